@@ -0,0 +1,84 @@
+"""
+已处理URL成员判断的基准：比较Python集合（原来的processed_urls）、布隆过滤器和SQLite主键查询
+每百万条URL的内存占用与查询耗时
+
+用法（forum_monitor依赖机器人框架的plugins.plugin，需在框架根目录下运行）：
+    PYTHONPATH=. python plugins/<插件目录>/bench_bloom.py [--count N] [--error-rate P] [--probes N]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+from forum_monitor import BloomFilter
+
+
+def make_urls(count, prefix='https://forum.example.com/archives/'):
+    return [f'{prefix}{i}.html' for i in range(count)]
+
+
+def timed_probe(check, urls):
+    """平均每次查询的微秒数"""
+    started = time.perf_counter()
+    for url in urls:
+        check(url)
+    return (time.perf_counter() - started) / len(urls) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='已处理URL成员判断基准')
+    parser.add_argument('--count', type=int, default=1000000, help='已处理URL数')
+    parser.add_argument('--error-rate', type=float, default=0.001, help='布隆过滤器误判率')
+    parser.add_argument('--probes', type=int, default=100000, help='查询次数')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    scale = 1000000 / args.count
+
+    # URL字符串与集合一起计入，与processed_urls在内存中的实际占用一致
+    tracemalloc.start()
+    urls = make_urls(args.count)
+    processed = set(urls)
+    set_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    bloom = BloomFilter(os.path.join(workdir, 'bench.bloom'), args.count, args.error_rate)
+    started = time.perf_counter()
+    bloom.update(urls)
+    build_seconds = time.perf_counter() - started
+
+    conn = sqlite3.connect(os.path.join(workdir, 'bench.db'))
+    conn.execute('CREATE TABLE processed_urls (url TEXT PRIMARY KEY) WITHOUT ROWID')
+    with conn:
+        conn.executemany('INSERT INTO processed_urls (url) VALUES (?)', ((url,) for url in urls))
+    db_bytes = os.path.getsize(os.path.join(workdir, 'bench.db'))
+
+    new_urls = make_urls(args.probes, 'https://forum.example.com/new/')
+    old_urls = random.sample(urls, min(args.probes, len(urls)))
+    false_positives = sum(url in bloom for url in new_urls)
+    assert all(url in bloom for url in old_urls), '布隆过滤器漏判'
+
+    def sqlite_check(url):
+        return conn.execute('SELECT 1 FROM processed_urls WHERE url = ?', (url,)).fetchone() is not None
+
+    print(f'已处理URL {args.count} 条，以下内存按每百万条折算')
+    print(f'  Python集合（含URL字符串）  {set_bytes * scale / 1024 / 1024:8.1f}MB')
+    print(
+        f'  布隆过滤器                 {bloom.size_bytes() * scale / 1024 / 1024:8.2f}MB  '
+        f'哈希数 {bloom.hashes}，实测误判率 {false_positives / len(new_urls):.3%}，构建 {build_seconds:.1f}秒'
+    )
+    print(f'  SQLite文件（不占常驻内存）  {db_bytes * scale / 1024 / 1024:8.1f}MB')
+    print('未处理URL的平均查询耗时')
+    print(f'  Python集合   {timed_probe(processed.__contains__, new_urls):6.2f}us')
+    print(f'  布隆过滤器   {timed_probe(bloom.__contains__, new_urls):6.2f}us')
+    print(f'  SQLite主键   {timed_probe(sqlite_check, new_urls):6.2f}us')
+    print('已处理URL的平均查询耗时（布隆过滤器命中后仍需查SQLite）')
+    print(f'  布隆+SQLite  {timed_probe(lambda url: url in bloom and sqlite_check(url), old_urls):6.2f}us')
+    bloom.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+帖子详情提取的微基准：比较整页BeautifulSoup解析、SoupStrainer限定解析和lxml增量解析
+的耗时、峰值内存和实际读取的字节数
+
+用法（forum_monitor依赖机器人框架的plugins.plugin，需在框架根目录下运行）：
+    PYTHONPATH=. python plugins/<插件目录>/bench_extract.py [保存的帖子页面.html ...] [--rounds N] [--chunk 字节数]
+不指定页面时使用内置的zibll主题样例页面
+"""
+import argparse
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+import forum_monitor
+from forum_monitor import DEFAULT_SELECTORS, PostExtractor
+
+
+def sample_page():
+    """生成结构与zibll主题帖子页相近的样例页面（大量脚本、导航、正文、评论和侧边栏）"""
+    head = ''.join(f'<script>var cfg{i} = {{"a": {i}, "b": "{"x" * 200}"}};</script>' for i in range(40))
+    head += ''.join(f'<link rel="stylesheet" href="/wp-content/themes/zibll/css/{i}.css">' for i in range(20))
+    nav = ''.join(f'<li class="menu-item"><a href="/category/{i}">分类{i}</a></li>' for i in range(60))
+    content = ''.join(f'<p>正文段落{i}，{"内容" * 80}</p>' for i in range(150))
+    comments = ''.join(
+        f'<li class="comment"><div class="comment-author"><span class="display-name">评论者{i}</span></div>'
+        f'<div class="comment-content"><p>{"评论" * 40}</p></div></li>'
+        for i in range(120)
+    )
+    sidebar = ''.join(f'<div class="widget"><h3>推荐{i}</h3><ul>{"<li><a href=/p/1>文章</a></li>" * 10}</ul></div>' for i in range(15))
+    return (
+        f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>样例帖子</title>{head}</head><body>'
+        f'<header class="header"><nav><ul class="nav">{nav}</ul></nav></header>'
+        '<main class="container"><div class="content-wrap"><article class="article main-bg">'
+        '<div class="article-header"><h1 class="article-title"><a href="/p/1" title="样例帖子标题">样例帖子标题</a></h1>'
+        '<div class="article-meta"><div class="meta-left"><a class="avatar" href="/author/1">'
+        '<span class="display-name">样例作者</span></a></div></div></div>'
+        f'<div class="article-content">{content}</div></article>'
+        f'<div class="comment-box"><ol class="commentlist">{comments}</ol></div></div>'
+        f'<div class="sidebar">{sidebar}</div></main><footer class="footer">{"页脚" * 200}</footer></body></html>'
+    ).encode('utf-8')
+
+
+def full_soup(html, chunk_size):
+    """原来的做法：整页html.parser解析后再select_one"""
+    soup = BeautifulSoup(html, 'html.parser')
+    title = soup.select_one(DEFAULT_SELECTORS['title'])
+    author = soup.select_one(DEFAULT_SELECTORS['author'])
+    return (title.get('title') if title else None, author.text.strip() if author else None), len(html)
+
+
+def extractor_session(use_lxml):
+    """按指定路径构建提取器，分块喂入并在字段取齐时停止，返回(结果, 读取的字节数)"""
+    def run(html, chunk_size):
+        saved = forum_monitor.lxml_etree
+        if not use_lxml:
+            forum_monitor.lxml_etree = None
+        try:
+            extraction = PostExtractor().session()
+            read = 0
+            for start in range(0, len(html), chunk_size):
+                chunk = html[start:start + chunk_size]
+                read += len(chunk)
+                if extraction.feed(chunk):
+                    break
+            extraction.close()
+            return extraction.result(), read
+        finally:
+            forum_monitor.lxml_etree = saved
+    return run
+
+
+def measure(func, html, rounds, chunk_size):
+    result, read = func(html, chunk_size)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func(html, chunk_size)
+    elapsed = (time.perf_counter() - started) / rounds
+    tracemalloc.start()
+    func(html, chunk_size)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, read, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='帖子详情提取微基准')
+    parser.add_argument('pages', nargs='*', help='保存的帖子页面HTML文件')
+    parser.add_argument('--rounds', type=int, default=50, help='每种方式重复的次数')
+    parser.add_argument('--chunk', type=int, default=16384, help='模拟流式读取时每块的字节数')
+    args = parser.parse_args()
+
+    pages = [(path, open(path, 'rb').read()) for path in args.pages] or [('内置样例', sample_page())]
+    methods = [('整页BeautifulSoup', full_soup), ('SoupStrainer', extractor_session(False))]
+    if forum_monitor.lxml_etree:
+        methods.append(('lxml增量', extractor_session(True)))
+    else:
+        print('未安装lxml/cssselect，跳过lxml增量解析')
+
+    for name, html in pages:
+        print(f'{name}：{len(html) / 1024:.1f}KB')
+        for label, func in methods:
+            result, read, elapsed, peak = measure(func, html, args.rounds, args.chunk)
+            print(
+                f'  {label:<16} {elapsed * 1000:8.2f}ms  峰值内存 {peak / 1024:8.1f}KB  '
+                f'读取 {read / 1024:7.1f}KB  结果 {result}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,164 +1,2385 @@
 import time
+import asyncio
 import xml.etree.ElementTree as ET
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta
 import pytz
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import os
 import re
 import json
 import shutil
-from threading import Thread, Event, Lock
-from collections import defaultdict
+import hashlib
+import uuid
+import heapq
+import base64
+from array import array
+from bisect import bisect_left
+import math
+import mmap
+import struct
+import random
+import queue
+from threading import Thread, Event, Lock, Condition
+from collections import defaultdict, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from plugins.plugin import Plugin
 import threading
+import sqlite3
+import atexit
+from urllib.parse import urlsplit
+from html import unescape
+from email.utils import parsedate_to_datetime
+from string import Formatter
 
-class Forum_monitor(Plugin):
+DEFAULT_SOURCE_NAME = '默认论坛'
+RECORD_TIME_FORMAT = '%Y年%m月%d日 %H:%M:%S'
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+SITEMAP_NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+NEWS_NS = '{http://www.google.com/schemas/sitemap-news/0.9}'
+IMAGE_NS = '{http://www.google.com/schemas/sitemap-image/1.1}'
+DC_NS = '{http://purl.org/dc/elements/1.1/}'
+
+# 可批量获取帖子标题和作者的元数据来源，都取不到时再抓取帖子页面
+METADATA_SOURCES = ('sitemap', 'rss', 'wp-json')
+
+try:
+    import brotli  # noqa: F401  安装brotli后urllib3才能解码br压缩
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    from lxml import etree as lxml_etree
+    from cssselect import GenericTranslator
+except ImportError:
+    lxml_etree = None
+
+# 帖子页面的默认选择器（zibll主题），可在config.yaml的selectors及各源中覆盖
+DEFAULT_SELECTORS = {
+    'title': 'h1.article-title a',
+    'title_attr': 'title',
+    'author': '.meta-left .display-name',
+}
+
+
+# 未设置当前模板（TS模板 设置）时使用的推送消息
+DEFAULT_TEMPLATE = (
+    "📢 论坛新贴通知 📢\n"
+    "━━━━━━━━━━━━━━\n"
+    "📌 标题：{title}\n"
+    "👤 作者：{author}\n"
+    "🕒 时间：{time}\n"
+    "🔗 链接：{url}\n"
+    "━━━━━━━━━━━━━━\n"
+    "💬 复制链接浏览器打开去评论吧！"
+)
+
+
+def parse_record_time(text):
+    """解析历史记录中的时间（convert_time的输出格式），失败返回None"""
+    try:
+        return datetime.strptime(text, RECORD_TIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_lastmod(text):
+    """解析sitemap中的lastmod（W3C时间格式），不带时区的按UTC处理，失败返回None"""
+    try:
+        dt = datetime.fromisoformat(text.strip().replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=pytz.UTC)
+    return dt
+
+
+def parse_retry_after(value):
+    """解析Retry-After响应头（秒数或HTTP日期），返回需要等待的秒数，失败返回None"""
+    if not value:
+        return None
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    """在连接池新建连接时回调计数的适配器"""
+
+    def __init__(self, on_new_connection, **kwargs):
+        # 需在父类初始化前设置，父类__init__会调用init_poolmanager
+        self._on_new_connection = on_new_connection
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        on_new_connection = self._on_new_connection
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            def _new_conn(self):
+                on_new_connection()
+                return super()._new_conn()
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                on_new_connection()
+                return super()._new_conn()
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+
+class FetchClient:
+    """
+    共享的HTTP客户端（线程安全）
+    基于requests.Session连接池复用同一站点的TCP/TLS连接，带重试退避，
+    并统计请求数与新建连接数以确认连接复用情况
+    """
+
+    def __init__(self, timeout=10, pool_size=10, retries=2, backoff=0.5):
+        self.timeout = timeout
+        self._stats_lock = Lock()
+        self._requests = 0
+        self._connections = 0
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            # 503与429一样是限流信号，不在请求线程里重试，连同Retry-After交给调用方（自适应间隔）退避
+            status_forcelist=(500, 502, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            respect_retry_after_header=False,
+        )
+        adapter = _CountingHTTPAdapter(
+            self._count_connection,
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.headers.update({
+            'User-Agent': USER_AGENT,
+            'Accept-Encoding': ACCEPT_ENCODING,
+        })
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def from_config(cls, config):
+        """根据config.yaml中的http配置创建客户端"""
+        config = config or {}
+        return cls(
+            timeout=config.get('timeout', 10),
+            pool_size=config.get('pool_size', 10),
+            retries=config.get('retries', 2),
+            backoff=config.get('backoff', 0.5),
+        )
+
+    def _count_connection(self):
+        with self._stats_lock:
+            self._connections += 1
+
+    def get(self, url, **kwargs):
+        """发起GET请求，默认使用客户端的超时设置"""
+        kwargs.setdefault('timeout', self.timeout)
+        with self._stats_lock:
+            self._requests += 1
+        return self.session.get(url, **kwargs)
+
+    def stats(self):
+        """返回请求数、新建连接数和复用连接数"""
+        with self._stats_lock:
+            return {
+                'requests': self._requests,
+                'opened': self._connections,
+                'reused': max(self._requests - self._connections, 0),
+            }
+
+
+class FetchResult:
+    """异步抓取的结果，与requests.Response的常用属性同名"""
+
+    def __init__(self, url, status_code, headers, text=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+
+class AsyncFetcher:
+    """
+    运行在独立事件循环线程上的抓取引擎（线程安全）
+    安装了aiohttp时在事件循环中并发请求；否则退回共享的FetchClient，在有限的线程池中执行。
+    每个站点的并发数由信号量限制，每次请求有总超时；同步代码通过fetch_text/stream阻塞等待结果，
+    或用submit_text/submit_stream拿到concurrent.futures.Future并发提交大量请求。
+    流式读取时分块的解析（on_chunk）在专门的解析线程中执行，不阻塞事件循环上的其他请求
+    """
+
+    PARSE_LANES = 4  # 解析线程数，同一响应的各块及on_close始终在同一个线程中处理
+
+    def __init__(self, client, per_host=4, max_concurrency=32, total_timeout=30, retries=2, backoff=0.5):
+        self.client = client
+        self.per_host = per_host
+        self.total_timeout = total_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._host_limits = {}  # 站点 -> asyncio.Semaphore，只在事件循环线程中访问
+        self._global_limit = None
+        self._max_concurrency = max_concurrency
+        self._session = None
+        self._executor = None if aiohttp else ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix='FetchFallback'
+        )
+        self._parse_lanes = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'FetchParse{i}')
+            for i in range(self.PARSE_LANES)
+        ] if aiohttp else []
+        self._next_lane = 0  # 只在事件循环线程中访问
+        self._stats_lock = Lock()
+        self._requests = 0
+        self._connections = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self._run_loop, name='AsyncFetch', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, client, config):
+        """根据config.yaml中的http配置创建抓取引擎"""
+        config = config or {}
+        return cls(
+            client,
+            per_host=config.get('per_host', 4),
+            max_concurrency=config.get('max_concurrency', 32),
+            total_timeout=config.get('total_timeout', 30),
+            retries=config.get('retries', 2),
+            backoff=config.get('backoff', 0.5),
+        )
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def close(self):
+        """关闭会话并停止事件循环"""
+        if not self._thread.is_alive():
+            return
+        if self._session:
+            asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+        for lane in self._parse_lanes:
+            lane.shutdown(wait=False)
+
+    def stats(self):
+        """返回请求数、新建连接数和复用连接数"""
+        if not aiohttp:
+            return self.client.stats()
+        with self._stats_lock:
+            return {
+                'requests': self._requests,
+                'opened': self._connections,
+                'reused': max(self._requests - self._connections, 0),
+            }
+
+    # ---- 同步门面 ----
+
+    def submit_text(self, url, headers=None, timeout=None):
+        """提交GET请求，返回结果为FetchResult（含text）的concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(self._guarded(url, self._fetch_text, headers, timeout), self._loop)
+
+    def fetch_text(self, url, headers=None, timeout=None):
+        """GET请求并返回FetchResult（含text），状态码>=400时抛出requests.HTTPError"""
+        return self.submit_text(url, headers, timeout).result()
+
+    def submit_stream(self, url, on_chunk, headers=None, timeout=None, on_close=None):
+        """
+        提交GET请求并把响应内容分块交给on_chunk，on_chunk返回True时停止读取；
+        读取结束后在同一线程调用on_close（如有）。
+        304时不读取内容，返回结果为FetchResult（不含text）的concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._guarded(url, self._stream, headers, timeout, on_chunk, on_close), self._loop
+        )
+
+    def stream(self, url, on_chunk, headers=None, timeout=None, on_close=None):
+        """submit_stream的阻塞版本"""
+        return self.submit_stream(url, on_chunk, headers, timeout, on_close).result()
+
+    # ---- 事件循环内部 ----
+
+    async def _guarded(self, url, fetch, headers, timeout, *args):
+        """在全局与站点并发上限内执行请求，并统一超时与异常类型"""
+        if self._global_limit is None:
+            self._global_limit = asyncio.Semaphore(self._max_concurrency)
+        host = urlsplit(url).netloc
+        host_limit = self._host_limits.get(host)
+        if host_limit is None:
+            host_limit = self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        async with self._global_limit, host_limit:
+            try:
+                return await asyncio.wait_for(
+                    fetch(url, headers or {}, timeout or self.client.timeout, *args),
+                    self.total_timeout
+                )
+            except asyncio.TimeoutError:
+                raise requests.Timeout(f"请求超时: {url}")
+
+    def _check_status(self, result):
+        if result.status_code >= 400:
+            raise requests.HTTPError(f"{result.status_code} Error for url: {result.url}", response=result)
+        return result
+
+    async def _fetch_text(self, url, headers, timeout):
+        if not aiohttp:
+            return await self._loop.run_in_executor(self._executor, self._sync_fetch_text, url, headers, timeout)
+
+        async def read(response):
+            return await response.text(encoding='utf-8', errors='replace')
+        return await self._aiohttp_request(url, headers, timeout, read)
+
+    async def _stream(self, url, headers, timeout, on_chunk, on_close):
+        if not aiohttp:
+            return await self._loop.run_in_executor(
+                self._executor, self._sync_stream, url, headers, timeout, on_chunk, on_close
+            )
+
+        # 轮流分配解析线程；lxml的解析对象不能跨线程使用，同一响应固定在一个线程中
+        lane = self._parse_lanes[self._next_lane % len(self._parse_lanes)]
+        self._next_lane += 1
+
+        async def read(response):
+            if response.status == 304:
+                return None
+            try:
+                async for chunk in response.content.iter_chunked(16 * 1024):
+                    if await self._loop.run_in_executor(lane, on_chunk, chunk):
+                        break
+            finally:
+                if on_close:
+                    await self._loop.run_in_executor(lane, on_close)
+            return None
+        return await self._aiohttp_request(url, headers, timeout, read)
+
+    async def _get_session(self):
+        if self._session is None:
+            trace = aiohttp.TraceConfig()
+            trace.on_connection_create_end.append(self._on_connection_created)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._max_concurrency, limit_per_host=self.per_host),
+                headers={'User-Agent': USER_AGENT, 'Accept-Encoding': ACCEPT_ENCODING},
+                trace_configs=[trace],
+            )
+        return self._session
+
+    async def _on_connection_created(self, session, context, params):
+        with self._stats_lock:
+            self._connections += 1
+
+    async def _aiohttp_request(self, url, headers, timeout, read):
+        """aiohttp请求，连接错误和5xx（503除外）按退避重试，与FetchClient的重试策略一致"""
+        session = await self._get_session()
+        attempt = 0
+        while True:
+            with self._stats_lock:
+                self._requests += 1
+            try:
+                async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    if response.status in (500, 502, 504) and attempt < self.retries:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history, status=response.status
+                        )
+                    text = None
+                    if response.status < 400:
+                        text = await read(response)
+                    return self._check_status(FetchResult(
+                        url, response.status, requests.structures.CaseInsensitiveDict(response.headers), text
+                    ))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.retries:
+                    raise requests.ConnectionError(f"请求失败: {url} ({e})")
+            await asyncio.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
+
+    def _sync_fetch_text(self, url, headers, timeout):
+        response = self.client.get(url, headers=headers, timeout=timeout)
+        response.encoding = 'utf-8'
+        return self._check_status(FetchResult(url, response.status_code, response.headers, response.text))
+
+    def _sync_stream(self, url, headers, timeout, on_chunk, on_close):
+        response = self.client.get(url, headers=headers, timeout=timeout, stream=True)
+        try:
+            result = FetchResult(url, response.status_code, response.headers)
+            if response.status_code < 400 and response.status_code != 304:
+                try:
+                    for chunk in response.iter_content(chunk_size=16 * 1024):
+                        if on_chunk(chunk):
+                            break
+                finally:
+                    if on_close:
+                        on_close()
+            return self._check_status(result)
+        finally:
+            response.close()
+
+
+class PostExtractor:
+    """
+    按CSS选择器从帖子页面提取标题和作者
+    安装了lxml和cssselect时增量解析，标题和作者都已完整读到即可停止读取响应；
+    否则用BeautifulSoup解析，并用SoupStrainer只构建各选择器首段匹配的子树
+    """
+
+    FIELDS = ('title', 'author')
+
+    def __init__(self, selectors=None):
+        self.selectors = dict(DEFAULT_SELECTORS, **(selectors or {}))
+        if lxml_etree:
+            translator = GenericTranslator()
+            self._xpaths = {field: translator.css_to_xpath(self.selectors[field]) for field in self.FIELDS}
+        else:
+            self._strainer = self._build_strainer()
+
+    def _build_strainer(self):
+        """根据各选择器的首段（如h1.article-title）构建SoupStrainer，无法限定时返回None"""
+        compounds = []
+        for field in self.FIELDS:
+            match = re.match(r'([\w-]*)((?:[.#][\w-]+)*)(?=\s|$)', self.selectors[field].strip())
+            if not match:
+                return None
+            classes = re.findall(r'\.([\w-]+)', match.group(2))
+            compounds.append((match.group(1), classes))
+        if all(classes for _, classes in compounds):
+            wanted = {classes[0] for _, classes in compounds}
+
+            def class_filter(value):
+                values = value.split() if isinstance(value, str) else (value or [])
+                return not wanted.isdisjoint(values)
+            return SoupStrainer(class_=class_filter)
+        if all(name for name, _ in compounds):
+            return SoupStrainer([name for name, _ in compounds])
+        return None
+
+    def session(self):
+        """
+        开始一次提取：feed(chunk)在字段都已取到时返回True，close()结束读取，result()返回(标题, 作者)
+        lxml的解析对象不能跨线程使用，feed与close须在同一线程调用
+        """
+        return _LxmlExtraction(self) if lxml_etree else _SoupExtraction(self)
+
+    def extract(self, html):
+        """从完整的页面内容提取(标题, 作者)，未找到的字段为None"""
+        extraction = self.session()
+        extraction.feed(html)
+        extraction.close()
+        return extraction.result()
+
+    def _value(self, field, text, attrs):
+        """标题优先取title_attr属性，否则取元素文本"""
+        value = None
+        if field == 'title' and self.selectors.get('title_attr'):
+            value = attrs.get(self.selectors['title_attr'])
+        value = (value or text or '').strip()
+        return value or None
+
+
+class _LxmlExtraction:
+    """lxml增量解析，每块数据到达后只对已完整闭合的元素求值"""
+
+    def __init__(self, extractor):
+        self._extractor = extractor
+        self._parser = None  # 在读取线程中创建
+        self._root = None
+        self._values = {}
+
+    def feed(self, chunk):
+        if self._parser is None:
+            self._parser = lxml_etree.HTMLPullParser(events=('start',), encoding='utf-8')
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        self._parser.feed(chunk)
+        for _, element in self._parser.read_events():
+            if self._root is None:
+                self._root = element.getroottree().getroot()
+        if self._root is not None:
+            self._collect(complete_only=True)
+        return len(self._values) == len(PostExtractor.FIELDS)
+
+    def close(self):
+        """读取结束，用已读到的内容补齐缺失字段并释放解析树"""
+        if self._parser is not None and len(self._values) < len(PostExtractor.FIELDS):
+            try:
+                self._root = self._parser.close()
+            except lxml_etree.XMLSyntaxError:
+                pass
+            if self._root is not None:
+                self._collect(complete_only=False)
+        self._parser = self._root = None
+
+    def result(self):
+        return self._values.get('title'), self._values.get('author')
+
+    def _collect(self, complete_only):
+        for field in PostExtractor.FIELDS:
+            if field in self._values:
+                continue
+            for element in self._root.xpath(self._extractor._xpaths[field]):
+                if complete_only and not self._is_complete(element):
+                    break
+                value = self._extractor._value(field, ''.join(element.itertext()), element.attrib)
+                if value:
+                    self._values[field] = value
+                    break
+
+    @staticmethod
+    def _is_complete(element):
+        """元素自身或某个祖先之后已有兄弟节点，说明元素已闭合"""
+        while element is not None:
+            if element.getnext() is not None:
+                return True
+            element = element.getparent()
+        return False
+
+
+class _SoupExtraction:
+    """BeautifulSoup解析，需要读完整个页面"""
+
+    def __init__(self, extractor):
+        self._extractor = extractor
+        self._chunks = []
+
+    def feed(self, chunk):
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        self._chunks.append(chunk)
+        return False
+
+    def close(self):
+        pass
+
+    def result(self):
+        html = b''.join(self._chunks).decode('utf-8', errors='replace')
+        soup = BeautifulSoup(html, 'html.parser', parse_only=self._extractor._strainer)
+        values = []
+        for field in PostExtractor.FIELDS:
+            element = soup.select_one(self._extractor.selectors[field])
+            values.append(self._extractor._value(field, element.get_text(), element.attrs) if element else None)
+        return tuple(values)
+
+
+class DetailsCache:
+    """
+    帖子详情的LRU缓存（线程安全）
+    以URL为键保存(标题, 作者)及页面的ETag/Last-Modified，超过ttl秒的条目需带校验信息重新请求，
+    超过max_entries时淘汰最久未使用的条目；可选持久化到文件，重启后继续使用
+    """
+
+    def __init__(self, max_entries=500, ttl=3600, cache_file=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_file = cache_file
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'revalidated': 0, 'evictions': 0}
+        self.load()
+
+    def get(self, url):
+        """返回(条目, 是否未过期)，没有缓存时返回(None, False)；过期的条目计为未命中，另计入expired"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None, False
+            self._entries.move_to_end(url)
+            if time.time() - entry['time'] < self.ttl:
+                self.stats['hits'] += 1
+                return dict(entry), True
+            self.stats['misses'] += 1
+            self.stats['expired'] += 1
+            return dict(entry), False
+
+    def put(self, url, title, author, etag=None, last_modified=None):
+        with self._lock:
+            self._entries[url] = {
+                'title': title,
+                'author': author,
+                'etag': etag,
+                'last_modified': last_modified,
+                'time': time.time(),
+            }
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def revalidate(self, url):
+        """条件请求返回304，条目重新计时"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry:
+                entry['time'] = time.time()
+                self.stats['revalidated'] += 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def load(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            with self._lock:
+                self._entries = OrderedDict(list(entries.items())[-self.max_entries:])
+        except (OSError, ValueError) as e:
+            print(f"加载详情缓存失败: {e}")
+
+    def save(self):
+        if not self.cache_file:
+            return
+        try:
+            with self._lock:
+                entries = dict(self._entries)
+            temp_file = self.cache_file + '.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            print(f"保存详情缓存失败: {e}")
+
+
+class _Delivery:
+    """一条消息对多个接收者的发送结果，全部完成后回调on_done({接收者: 是否成功})"""
+
+    def __init__(self, receivers, on_done=None):
+        self._remaining = len(receivers)
+        self._on_done = on_done
+        self._lock = Lock()
+        self._finished = Event()
+        self.results = {}
+        if not receivers:
+            self._finish()
+
+    def record(self, receiver, ok):
+        with self._lock:
+            self.results[receiver] = ok
+            self._remaining -= 1
+            finished = self._remaining == 0
+        if finished:
+            self._finish()
+
+    def _finish(self):
+        self._finished.set()
+        if self._on_done:
+            try:
+                self._on_done(dict(self.results))
+            except Exception as e:
+                print(f"处理发送结果失败: {e}")
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+
+class TokenBucket:
+    """令牌桶，rate为每秒补充的令牌数（0表示不限速），capacity为允许的突发量；由调用方加锁"""
+
+    def __init__(self, rate=0, capacity=1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now):
+        """预留一个令牌，返回拿到令牌前需要等待的秒数；令牌可以预支，后来者排在后面等待"""
+        if not self.rate:
+            return 0
+        self.tokens = min(self.capacity, self.tokens + max(now - self.updated, 0) * self.rate)
+        self.updated = max(now, self.updated)
+        self.tokens -= 1
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RateLimiter:
+    """
+    发送限速（线程安全）
+    全局一个令牌桶、每个接收者一个令牌桶，超出速率的发送在调用线程中排队等待而不是被丢弃；
+    所有发送线程共用同一个限速器，并统计被限速的次数与等待时间
+    """
+
+    def __init__(self, rate=0, burst=1, receiver_rate=0, receiver_burst=1):
+        self._lock = Lock()
+        self._global = TokenBucket(rate, burst)
+        self.receiver_rate = receiver_rate
+        self.receiver_burst = receiver_burst
+        self._receivers = {}  # 接收者 -> TokenBucket
+        self._waiting = 0
+        self._stats = {'acquired': 0, 'throttled': 0, 'total_wait': 0.0, 'max_wait': 0.0}
+
+    def set_rate(self, rate):
+        """调整全局速率（条/秒），0表示不限速"""
+        with self._lock:
+            self._global.rate = rate
+            self._global.tokens = min(self._global.tokens, self._global.capacity)
+
+    def acquire(self, receiver):
+        """等待直到全局和该接收者都允许发送"""
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._receivers.get(receiver)
+            if bucket is None:
+                bucket = self._receivers[receiver] = TokenBucket(self.receiver_rate, self.receiver_burst)
+            wait = max(self._global.reserve(now), bucket.reserve(now))
+            self._stats['acquired'] += 1
+            if wait > 0:
+                self._stats['throttled'] += 1
+                self._stats['total_wait'] += wait
+                self._stats['max_wait'] = max(self._stats['max_wait'], wait)
+                self._waiting += 1
+        if wait > 0:
+            time.sleep(wait)
+            with self._lock:
+                self._waiting -= 1
+
+    def stats(self):
+        """发送次数、被限速次数、平均/最长等待秒数及当前排队等待的发送数"""
+        with self._lock:
+            stats = dict(self._stats, waiting=self._waiting)
+        stats['avg_wait'] = stats['total_wait'] / stats['throttled'] if stats['throttled'] else 0.0
+        return stats
+
+
+class DeliveryDispatcher:
+    """
+    推送分发器（线程安全）
+    每个接收者一个消息队列，由有限的工作线程并发发送：同一接收者的消息按入队顺序依次发送，
+    慢的接收者不会阻塞其他接收者。每次发送前经过共用的限速器排队，发送结果按接收者统计
+    """
+
+    def __init__(self, send, workers=4, limiter=None):
+        self._send = send
+        self.limiter = limiter or RateLimiter()
+        self._lock = Lock()
+        self._idle = Condition(self._lock)
+        self._queues = {}  # 接收者 -> deque[(消息, _Delivery)]，在就绪队列中或正在发送的接收者才有队列
+        self._ready = queue.Queue()
+        self._stats = defaultdict(lambda: {'sent': 0, 'failed': 0, 'last_error': None})
+        self._workers = [
+            Thread(target=self._work, name=f'Delivery-{i}', daemon=True)
+            for i in range(max(workers, 1))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @classmethod
+    def from_config(cls, send, config):
+        """根据config.yaml中的delivery配置创建分发器"""
+        config = config or {}
+        limiter = RateLimiter(
+            burst=config.get('burst', 3),
+            receiver_rate=config.get('receiver_rate', 1),
+            receiver_burst=config.get('receiver_burst', 1),
+        )
+        return cls(send, workers=config.get('workers', 4), limiter=limiter)
+
+    def dispatch(self, message, receivers, on_done=None):
+        """把消息加入各接收者的队列后立即返回_Delivery，全部发送完成后回调on_done"""
+        receivers = list(receivers)
+        delivery = _Delivery(receivers, on_done)
+        with self._lock:
+            for receiver in receivers:
+                if receiver not in self._queues:
+                    self._queues[receiver] = deque()
+                    self._ready.put(receiver)
+                self._queues[receiver].append((message, delivery))
+        return delivery
+
+    def pending(self):
+        """尚未发送的消息数"""
+        with self._lock:
+            return sum(len(messages) for messages in self._queues.values())
+
+    def receiver_stats(self):
+        """各接收者的发送成功、失败次数及最近错误"""
+        with self._lock:
+            return {receiver: dict(stats) for receiver, stats in self._stats.items()}
+
+    def drain(self, timeout=None):
+        """等待队列中的消息发送完毕，返回是否已全部发送"""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._queues, timeout)
+
+    def close(self):
+        for _ in self._workers:
+            self._ready.put(None)
+
+    def _work(self):
+        while True:
+            receiver = self._ready.get()
+            if receiver is None:
+                return
+            with self._lock:
+                message, delivery = self._queues[receiver].popleft()
+            self.limiter.acquire(receiver)
+            error = None
+            try:
+                self._send(message, receiver)
+            except Exception as e:
+                error = str(e)
+                current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                print(f"[{current_time}] 发送到 {receiver} 失败: {e}")
+            ok = error is None
+            with self._lock:
+                stats = self._stats[receiver]
+                stats['sent' if ok else 'failed'] += 1
+                if not ok:
+                    stats['last_error'] = error
+                if self._queues[receiver]:
+                    self._ready.put(receiver)
+                else:
+                    del self._queues[receiver]
+                    if not self._queues:
+                        self._idle.notify_all()
+            delivery.record(receiver, ok)
+
+
+class RetryScheduler:
+    """
+    帖子重试调度器（线程安全）
+    条目按下次尝试时间放在小根堆中，另有URL索引用于O(1)判断是否在等待重试；
+    退避时间按尝试次数指数增长并带随机抖动，避免同时失败的帖子在同一时刻重试
+    """
+
+    JITTER = 0.2  # 退避时间上下浮动的比例
+
+    def __init__(self, max_delay=3600):
+        self.max_delay = max_delay
+        self._heap = []  # (下次尝试时间, 序号, url)
+        self._items = {}  # url -> 条目
+        self._seq = 0
+        self._lock = Lock()
+
+    def backoff(self, base_delay, attempts):
+        """第attempts次重试前等待的秒数"""
+        delay = min(base_delay * 2 ** attempts, self.max_delay)
+        return delay * random.uniform(1 - self.JITTER, 1 + self.JITTER)
+
+    def schedule(self, url, lastmod=None, attempts=0, base_delay=60):
+        """安排（或重新安排）一个帖子的重试"""
+        with self._lock:
+            self._seq += 1
+            next_attempt_at = time.time() + self.backoff(base_delay, attempts)
+            self._items[url] = {
+                'url': url,
+                'lastmod': lastmod,
+                'attempts': attempts,
+                'next_attempt_at': next_attempt_at,
+                'seq': self._seq,
+            }
+            heapq.heappush(self._heap, (next_attempt_at, self._seq, url))
+
+    def pop_due(self, now=None):
+        """取出所有已到期的条目"""
+        now = time.time() if now is None else now
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, seq, url = heapq.heappop(self._heap)
+                item = self._items.get(url)
+                # 被重新安排过的条目在堆中留有旧记录，跳过
+                if item is not None and item['seq'] == seq:
+                    del self._items[url]
+                    due.append(item)
+        return due
+
+    def next_due(self):
+        """最早条目的到期时间，没有条目时返回None"""
+        with self._lock:
+            while self._heap:
+                next_attempt_at, seq, url = self._heap[0]
+                item = self._items.get(url)
+                if item is not None and item['seq'] == seq:
+                    return next_attempt_at
+                heapq.heappop(self._heap)
+        return None
+
+    def __contains__(self, url):
+        return url in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
+class JobScheduler:
+    """
+    后台任务调度器（线程安全）
+    各任务按下次运行时间放在小根堆中，调度线程用Event.wait一直等到最早的任务到期或安排有变化，
+    到期的任务交给线程池执行；任务函数返回下次运行前等待的秒数，返回None则暂停到再次被安排。
+    同一任务不会并发运行，运行期间到期的会在结束后立即再运行一次
+    """
+
+    ERROR_DELAY = 60  # 任务出错后再次运行前等待的秒数
+
+    def __init__(self, workers=4):
+        self._heap = []  # (运行时间, 序号, 任务名)
+        self._jobs = {}  # 任务名 -> 任务状态
+        self._seq = 0
+        self._lock = Lock()
+        self._changed = Event()
+        self._stopped = Event()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Job')
+        self._thread = Thread(target=self._run, name='Scheduler', daemon=True)
+        self._thread.start()
+
+    def register(self, name, func):
+        """登记任务，登记后需schedule才会运行"""
+        with self._lock:
+            self._jobs[name] = {'func': func, 'due': None, 'seq': 0, 'running': False, 'rerun': False}
+
+    def schedule(self, name, delay=0, earlier_only=False):
+        """安排任务在delay秒后运行；earlier_only为True时只会把已有的安排提前"""
+        with self._lock:
+            job = self._jobs[name]
+            due = time.time() + max(delay, 0)
+            if earlier_only and job['due'] is not None and job['due'] <= due:
+                return
+            self._push(name, job, due)
+        self._changed.set()
+
+    def cancel(self, name):
+        """取消任务尚未开始的安排，正在运行的不受影响"""
+        with self._lock:
+            job = self._jobs[name]
+            job['due'] = None
+            job['rerun'] = False
+            job['seq'] = 0
+        self._changed.set()
+
+    def next_run(self, name):
+        """任务的下次运行时间，未安排时返回None"""
+        with self._lock:
+            return self._jobs[name]['due']
+
+    def stop(self, timeout=1):
+        self._stopped.set()
+        self._changed.set()
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    def _push(self, name, job, due):
+        # 重新安排后堆中的旧记录靠序号识别并跳过
+        self._seq += 1
+        job['due'] = due
+        job['seq'] = self._seq
+        heapq.heappush(self._heap, (due, self._seq, name))
+
+    def _run(self):
+        while not self._stopped.is_set():
+            with self._lock:
+                now = time.time()
+                while self._heap and self._heap[0][0] <= now:
+                    _, seq, name = heapq.heappop(self._heap)
+                    job = self._jobs[name]
+                    if job['seq'] != seq:
+                        continue
+                    job['due'] = None
+                    if job['running']:
+                        job['rerun'] = True
+                        continue
+                    job['running'] = True
+                    self._executor.submit(self._execute, name, job)
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._changed.clear()
+            self._changed.wait(timeout)
+
+    def _execute(self, name, job):
+        try:
+            delay = job['func']()
+        except Exception as e:
+            print(f"后台任务 {name} 运行失败: {e}")
+            delay = self.ERROR_DELAY
+        with self._lock:
+            job['running'] = False
+            if job['rerun']:
+                job['rerun'] = False
+                delay = 0
+            if delay is not None:
+                due = time.time() + max(delay, 0)
+                # 运行期间被安排了更早的时间时保留那次安排
+                if job['due'] is None or due < job['due']:
+                    self._push(name, job, due)
+        self._changed.set()
+
+
+class ContentFilter:
+    """
+    内容过滤器（Aho-Corasick自动机）
+    关键词、黑名单和白名单编译进同一个自动机，标题、作者等文本一次线性扫描即可找出全部命中的词，
+    耗时与词的数量无关，不区分大小写。判断顺序：命中白名单一定推送，其次命中黑名单不推送，
+    设置了关键词时至少命中一个才推送
+    """
+
+    KINDS = ('keywords', 'blacklist', 'whitelist')
+
+    def __init__(self, keywords=(), blacklist=(), whitelist=()):
+        self._goto = [{}]  # 节点 -> {字符: 子节点}
+        self._fail = [0]
+        self._output = [()]  # 节点 -> 以该节点结尾的(类别, 词)
+        self._has_keywords = False
+        for kind, words in zip(self.KINDS, (keywords, blacklist, whitelist)):
+            for word in words:
+                self._add(kind, word)
+        self._build_fail_links()
+
+    def _add(self, kind, word):
+        node = 0
+        for char in word.casefold():
+            child = self._goto[node].get(char)
+            if child is None:
+                child = self._goto[node][char] = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            node = child
+        if node:
+            self._output[node] += ((kind, word),)
+            self._has_keywords = self._has_keywords or kind == 'keywords'
+
+    def _build_fail_links(self):
+        # 按层遍历，子节点的失败指针指向最长的可匹配后缀
+        pending = deque(self._goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for char, child in self._goto[node].items():
+                pending.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] += self._output[self._fail[child]]
+
+    def scan(self, *texts):
+        """返回文本中命中的词：{类别: {词}}"""
+        hits = defaultdict(set)
+        node = 0
+        # 以换行分隔各段文本，词中不含换行，不会跨段匹配
+        for char in '\n'.join(text or '' for text in texts).casefold():
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for kind, word in self._output[node]:
+                hits[kind].add(word)
+        return hits
+
+    def check(self, *texts):
+        """返回(是否推送, 命中的词)"""
+        hits = self.scan(*texts)
+        if hits['whitelist']:
+            return True, hits
+        if hits['blacklist']:
+            return False, hits
+        return bool(hits['keywords'] or not self._has_keywords), hits
+
+
+class RoutingIndex:
+    """
+    接收者路由索引
+    分组变化后重建一次：不限条件的接收者、按来源名、按关键词、按(来源名, 关键词)分别预先合并成
+    接收者 -> 路由名的字典，关键词编译进一个自动机；每条帖子只需扫描一次标题作者再查几次字典，
+    即可得到去重后的接收者及各自所属的路由
+    """
+
+    DEFAULT_ROUTE = '默认'
+
+    def __init__(self, default_receivers, groups):
+        self._everyone = {}  # 接收者 -> 路由名
+        self._by_source = defaultdict(dict)
+        self._by_keyword = defaultdict(dict)
+        self._by_pair = defaultdict(dict)  # (来源名, 关键词) -> {接收者: 路由名}
+        self.templates = {}  # 接收者 -> 所在分组设置的模板名
+        self._claim(self._everyone, default_receivers, self.DEFAULT_ROUTE)
+        keywords = set()
+        for name, group in groups.items():
+            members = [str(id) for id in group.get('notify_groups', []) + group.get('notify_users', [])]
+            if group.get('template'):
+                for receiver in members:
+                    self.templates.setdefault(receiver, group['template'])
+            sources, words = group.get('sources') or [], group.get('keywords') or []
+            keywords.update(words)
+            if not sources and not words:
+                self._claim(self._everyone, members, name)
+            for source in sources if not words else ():
+                self._claim(self._by_source[source], members, name)
+            for word in words if not sources else ():
+                self._claim(self._by_keyword[word], members, name)
+            for source in sources if words else ():
+                for word in words:
+                    self._claim(self._by_pair[(source, word)], members, name)
+        self._matcher = ContentFilter(keywords) if keywords else None
+
+    @staticmethod
+    def _claim(routes, receivers, name):
+        # 同一接收者在多个分组中时归入先出现的分组
+        for receiver in receivers:
+            routes.setdefault(str(receiver), name)
+
+    def route(self, source_name, *texts):
+        """返回{接收者: 路由名}，texts为用于匹配分组关键词的标题、作者等"""
+        words = self._matcher.scan(*texts)['keywords'] if self._matcher else ()
+        routes = dict(self._everyone)
+        for candidates in (
+            [self._by_source.get(source_name, {})]
+            + [self._by_keyword[word] for word in words]
+            + [self._by_pair.get((source_name, word), {}) for word in words]
+        ):
+            for receiver, name in candidates.items():
+                routes.setdefault(receiver, name)
+        return routes
+
+
+class MessageTemplate:
+    """
+    编译后的推送模板
+    添加时解析一次，拆成文本片段和占位符，占位符只能是FIELDS中的字段（不支持格式说明和属性访问），
+    渲染时直接按片段拼接
+    """
+
+    FIELDS = ('title', 'author', 'time', 'url')
+
+    def __init__(self, text):
+        self.text = text
+        self._parts = []  # (文本, 占位符字段或None)
+        try:
+            parsed = list(Formatter().parse(text))
+        except ValueError as e:
+            raise ValueError(f"模板中的花括号不匹配（{e}），需要原样输出花括号时请写成{{{{或}}}}")
+        for literal, field, format_spec, conversion in parsed:
+            if field is not None:
+                if field not in self.FIELDS:
+                    raise ValueError(f"不支持的占位符：{{{field}}}，可用：{self.placeholders()}")
+                if format_spec or conversion:
+                    raise ValueError(f"占位符 {{{field}}} 不支持格式说明")
+            self._parts.append((literal, field))
+
+    @classmethod
+    def placeholders(cls):
+        return " ".join(f"{{{field}}}" for field in cls.FIELDS)
+
+    def render(self, post):
+        """按帖子的字段渲染消息"""
+        return ''.join(literal + (str(post[field]) if field else '') for literal, field in self._parts)
+
+
+class SitemapStreamParser:
+    """
+    增量sitemap解析器
+    分块喂入响应内容，每解析完一个<url>就产出(loc, lastmod)并释放该元素，不在内存中保留整棵树。
+    根元素为<sitemapindex>时is_index为True，产出的是各子sitemap的(loc, lastmod)。
+    条目带有news:title或image:title扩展时，标题记录在titles中（loc -> 标题）。
+    指定stop_before时，若条目按lastmod倒序排列，遇到早于该时间（再减去grace秒）的条目即停止（stopped置为True）
+    """
+
+    def __init__(self, stop_before=None, grace=0):
+        self._parser = ET.XMLPullParser(events=('start', 'end'))
+        self._root = None
+        self._stop_before = parse_lastmod(stop_before) if stop_before else None
+        if self._stop_before is not None and grace:
+            self._stop_before -= timedelta(seconds=grace)
+        self._previous = None  # 上一个条目的lastmod
+        self._descending = True  # 目前为止是否一直是倒序
+        self._newest = None
+        self.newest_lastmod = None  # 已读取条目中最新的lastmod原文
+        self.is_index = False
+        self.stopped = False
+        self.titles = {}
+
+    def feed(self, chunk):
+        """喂入一段内容，返回本段解析出的条目列表"""
+        if self.stopped:
+            return []
+        self._parser.feed(chunk)
+        return self._drain()
+
+    def close(self):
+        """内容读取完毕，返回剩余条目"""
+        if self.stopped:
+            return []
+        self._parser.close()
+        return self._drain()
+
+    def _drain(self):
+        entries = []
+        for event, elem in self._parser.read_events():
+            if event == 'start':
+                if self._root is None:
+                    self._root = elem
+                    self.is_index = elem.tag == SITEMAP_NS + 'sitemapindex'
+                continue
+            if elem.tag != SITEMAP_NS + ('sitemap' if self.is_index else 'url'):
+                continue
+            loc = (elem.findtext(SITEMAP_NS + 'loc') or '').strip()
+            lastmod = (elem.findtext(SITEMAP_NS + 'lastmod') or '').strip()
+            title = (
+                elem.findtext(f'{NEWS_NS}news/{NEWS_NS}title')
+                or elem.findtext(f'{IMAGE_NS}image/{IMAGE_NS}title')
+                or ''
+            ).strip()
+            if loc and title:
+                self.titles[loc] = title
+            # 释放已处理的元素
+            elem.clear()
+            if self._root is not None and len(self._root) and self._root[-1] is elem:
+                self._root.remove(elem)
+            # 索引中的子sitemap可以没有lastmod（如WordPress自带的wp-sitemap.xml），帖子条目必须有
+            if not loc or (not lastmod and not self.is_index):
+                continue
+            if not self.is_index and self._should_stop(lastmod):
+                self.stopped = True
+                break
+            entries.append((loc, lastmod))
+        return entries
+
+    def _should_stop(self, lastmod):
+        """记录最新时间，并判断倒序排列时是否已读到旧条目"""
+        current = parse_lastmod(lastmod)
+        if current is None:
+            return False
+        if self._newest is None or current > self._newest:
+            self._newest = current
+            self.newest_lastmod = lastmod
+        previous, self._previous = self._previous, current
+        if previous is not None and current > previous:
+            self._descending = False
+        # 至少读到两个条目才能确认是倒序
+        return (
+            self._stop_before is not None
+            and not self.is_index
+            and previous is not None
+            and self._descending
+            and current < self._stop_before
+        )
+
+
+class WatermarkDedup:
+    """
+    基于lastmod高水位的去重状态（由JournalStore在锁内维护）
+    每个源只记住已处理帖子中最新的lastmod（高水位），早于高水位减grace秒的帖子视为已处理；
+    另保留最近window个已处理的URL，用来判断高水位附近同一时间或迟到的帖子。
+    移出窗口的URL只留下8字节指纹（按源分组的有序数组，附带lastmod），帖子被编辑、lastmod越过高水位时
+    仍能认出，且不依赖历史记录是否已被清理。
+    指纹的lastmod早于所属源高水位减retention秒后即被丢弃，此时未编辑的帖子已由高水位判断为已处理，
+    占用只与retention内的帖子数成正比；代价是更早的帖子被编辑后会再推送一次。
+    没有lastmod或来源的URL无法与高水位比较，按移出窗口的时间保留retention秒
+    """
+
+    MERGE_SIZE = 1024  # 新移出窗口的指纹先放入字典，攒够后再并入有序数组
+
+    def __init__(self, window=2000, grace=86400, retention=604800):
+        self.window = window
+        self.grace = grace
+        # 短于grace时，高水位还不能判断为已处理的帖子也会丢掉指纹
+        self.retention = max(retention, grace)
+        self.watermarks = {}  # 源URL -> 已处理帖子中最新的lastmod时间戳
+        self.recent = OrderedDict()  # url -> (lastmod时间戳, 源URL)，不知道时为None，按处理顺序
+        self.archived = {}  # 源URL（没有lastmod或来源时为''） -> (升序的指纹array('Q'), 对应的时间戳array('d'))
+        self._pending = {}  # 尚未并入archived的指纹 -> (源URL, 时间戳)
+
+    @staticmethod
+    def _timestamp(lastmod):
+        dt = parse_lastmod(lastmod) if lastmod else None
+        return dt.timestamp() if dt else None
+
+    @staticmethod
+    def fingerprint(url):
+        return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+
+    def mark(self, url, lastmod=None, source=None):
+        """记录已处理的帖子，source为所属源的URL，手动推送等不知道来源时只记入最近窗口"""
+        ts = self._timestamp(lastmod)
+        self.recent[url] = (ts, source)
+        self.recent.move_to_end(url)
+        while len(self.recent) > self.window:
+            evicted, (evicted_ts, evicted_source) = self.recent.popitem(last=False)
+            self._archive(self.fingerprint(evicted), evicted_ts, evicted_source)
+        if source and ts is not None and ts > self.watermarks.get(source, float('-inf')):
+            self.watermarks[source] = ts
+
+    def _archive(self, fingerprint, ts, source):
+        if ts is None or not source:
+            ts, source = time.time(), ''
+        self._pending[fingerprint] = (source, ts)
+        if len(self._pending) >= self.MERGE_SIZE:
+            self._merge()
+
+    def _cutoff(self, source):
+        """时间戳早于此值的指纹可以丢弃：源的高水位减retention，不分源的按当前时间计算"""
+        if not source:
+            return time.time() - self.retention
+        watermark = self.watermarks.get(source)
+        return watermark - self.retention if watermark is not None else float('-inf')
+
+    def _merge(self):
+        """把待并入的指纹按源并入有序数组，同时丢弃超出保留期的指纹"""
+        groups = defaultdict(list)
+        for fingerprint, (source, ts) in self._pending.items():
+            groups[source].append((fingerprint, ts))
+        self._pending.clear()
+        for source in set(self.archived) | set(groups):
+            fingerprints, times = self.archived.get(source, (array('Q'), array('d')))
+            cutoff = self._cutoff(source)
+            kept_fingerprints, kept_times = array('Q'), array('d')
+            for fingerprint, ts in heapq.merge(zip(fingerprints, times), sorted(groups.get(source, ()))):
+                if ts < cutoff:
+                    continue
+                if kept_fingerprints and kept_fingerprints[-1] == fingerprint:
+                    kept_times[-1] = max(kept_times[-1], ts)
+                    continue
+                kept_fingerprints.append(fingerprint)
+                kept_times.append(ts)
+            if kept_fingerprints:
+                self.archived[source] = (kept_fingerprints, kept_times)
+            else:
+                self.archived.pop(source, None)
+
+    @staticmethod
+    def _index(fingerprints, fingerprint):
+        index = bisect_left(fingerprints, fingerprint)
+        return index if index < len(fingerprints) and fingerprints[index] == fingerprint else -1
+
+    def _archived(self, fingerprint):
+        return fingerprint in self._pending or any(
+            self._index(fingerprints, fingerprint) >= 0 for fingerprints, _ in self.archived.values()
+        )
+
+    def archived_count(self):
+        return sum(len(fingerprints) for fingerprints, _ in self.archived.values()) + len(self._pending)
+
+    def discard(self, url):
+        self.recent.pop(url, None)
+        fingerprint = self.fingerprint(url)
+        self._pending.pop(fingerprint, None)
+        for fingerprints, times in self.archived.values():
+            index = self._index(fingerprints, fingerprint)
+            if index >= 0:
+                del fingerprints[index]
+                del times[index]
+
+    def clear(self):
+        self.watermarks.clear()
+        self.recent.clear()
+        self.archived = {}
+        self._pending.clear()
+
+    def __len__(self):
+        return len(self.recent) + self.archived_count()
+
+    def contains(self, url, lastmod=None, source=None):
+        """帖子是否已处理：在最近窗口或指纹中，或lastmod早于所属源的高水位减grace"""
+        if url in self.recent or self._archived(self.fingerprint(url)):
+            return True
+        ts = self._timestamp(lastmod)
+        watermark = self.watermarks.get(source)
+        return ts is not None and watermark is not None and ts < watermark - self.grace
+
+    def outdated(self, url, lastmod=None):
+        """最近窗口或指纹中记下的lastmod是否早于给出的lastmod（帖子已处理后又被编辑）"""
+        ts = self._timestamp(lastmod)
+        if ts is None:
+            return False
+        if url in self.recent:
+            seen_ts = self.recent[url][0]
+            return seen_ts is None or ts > seen_ts
+        fingerprint = self.fingerprint(url)
+        if fingerprint in self._pending:
+            source, seen_ts = self._pending[fingerprint]
+            return not source or ts > seen_ts
+        for source, (fingerprints, times) in self.archived.items():
+            index = self._index(fingerprints, fingerprint)
+            if index >= 0:
+                return not source or ts > times[index]
+        return False
+
+    @staticmethod
+    def _encode(values):
+        return base64.b64encode(values.tobytes()).decode('ascii')
+
+    @staticmethod
+    def _decode(typecode, text):
+        values = array(typecode)
+        values.frombytes(base64.b64decode(text))
+        return values
+
+    def to_dict(self):
+        self._merge()
+        return {
+            'watermarks': dict(self.watermarks),
+            'recent': [[url, ts, source] for url, (ts, source) in self.recent.items()],
+            'archived': {
+                source: [self._encode(fingerprints), self._encode(times)]
+                for source, (fingerprints, times) in self.archived.items()
+            },
+        }
+
+    def load(self, state):
+        state = state or {}
+        self.watermarks = dict(state.get('watermarks', {}))
+        self.recent = OrderedDict(
+            (item[0], (item[1], item[2] if len(item) > 2 else None)) for item in state.get('recent', [])
+        )
+        archived = state.get('archived') or {}
+        if isinstance(archived, str):
+            # 旧格式只有一个不分源、不带时间的指纹数组，从载入时起按不分源的保留期计算
+            fingerprints = self._decode('Q', archived)
+            archived = {'': (fingerprints, array('d', [time.time()]) * len(fingerprints))} if fingerprints else {}
+        else:
+            archived = {
+                source: (self._decode('Q', fingerprints), self._decode('d', times))
+                for source, (fingerprints, times) in archived.items()
+            }
+        self.archived = archived
+        self._pending.clear()
+
+
+class BloomFilter:
+    """
+    持久化的布隆过滤器（内存映射文件），放在已处理URL的精确存储前面
+    不在过滤器中的URL一定未处理，只需几次位探测；命中的（含约error_rate的误判）再查精确存储。
+    不支持删除，被移除的URL只会变成误判，由精确存储兜底。
+    文件不存在、参数不符或上次未正常关闭时stale为True，需要由精确存储重建
+    """
+
+    MAGIC = b'FMBLOOM1'
+    _HEADER = struct.Struct('<8sQQIQB')  # 标识、容量、位数、哈希数、已加入条数、未正常关闭标记
+    _HEADER_SIZE = 64
+
+    def __init__(self, path, capacity=1000000, error_rate=0.001):
+        self.path = path
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.bits, self.hashes = self._params(self.capacity, error_rate)
+        self.count = 0
+        self.stale = True
+        self._lock = Lock()
+        self._open()
+
+    @staticmethod
+    def _params(capacity, error_rate):
+        """按容量和误判率计算位数与哈希函数个数"""
+        bits = max(int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)), 8)
+        return bits, max(int(round(bits / capacity * math.log(2))), 1)
+
+    def _open(self):
+        self._file = open(self.path, 'r+b' if os.path.exists(self.path) else 'w+b')
+        header = self._file.read(self._HEADER.size)
+        if len(header) == self._HEADER.size:
+            magic, capacity, bits, hashes, count, dirty = self._HEADER.unpack(header)
+            # 已扩容过的文件容量大于配置，沿用文件中的参数
+            if (magic == self.MAGIC and capacity >= self.capacity
+                    and (bits, hashes) == self._params(capacity, self.error_rate)
+                    and os.path.getsize(self.path) == self._HEADER_SIZE + (bits + 7) // 8):
+                self.capacity, self.bits, self.hashes, self.count = capacity, bits, hashes, count
+                self.stale = bool(dirty)
+        size = self._HEADER_SIZE + (self.bits + 7) // 8
+        if self.stale:
+            self._file.truncate(0)
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        # 运行期间标记为未正常关闭，进程异常退出后下次启动会重建
+        self._write_header(dirty=True)
+
+    def _write_header(self, dirty):
+        self._map[:self._HEADER.size] = self._HEADER.pack(
+            self.MAGIC, self.capacity, self.bits, self.hashes, self.count, int(dirty)
+        )
+
+    def _positions(self, url):
+        # 双重哈希：由一个128位摘要派生出hashes个位置，逐个产出以便查询时遇到0位提前结束
+        digest = hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        offset, bits = self._HEADER_SIZE * 8, self.bits
+        for i in range(self.hashes):
+            yield offset + (h1 + i * h2) % bits
+
+    def __contains__(self, url):
+        data = self._map
+        for pos in self._positions(url):
+            if not data[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def add(self, url):
+        with self._lock:
+            data = self._map
+            added = False
+            for pos in self._positions(url):
+                byte = data[pos >> 3]
+                if not byte & (1 << (pos & 7)):
+                    data[pos >> 3] = byte | (1 << (pos & 7))
+                    added = True
+            if added:
+                self.count += 1
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def clear(self):
+        with self._lock:
+            self._map[self._HEADER_SIZE:] = bytes(len(self._map) - self._HEADER_SIZE)
+            self.count = 0
+
+    def size_bytes(self):
+        return len(self._map)
+
+    def flush(self):
+        with self._lock:
+            self._write_header(dirty=True)
+            self._map.flush()
+
+    def close(self):
+        """写回并关闭文件，标记为正常关闭"""
+        with self._lock:
+            if self._map.closed:
+                return
+            self._write_header(dirty=False)
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+
+
+class JournalStore:
+    """
+    追加日志存储
+    data.json 为快照，data.journal 为快照之后的变更日志（每行一条JSON记录），
+    加载时先读快照再按顺序重放日志；日志过长时在后台压缩为新快照
+    """
+
+    _file_lock = Lock()  # 同一进程内所有实例共用，保证日志写入与日志轮换互斥
+    _compact_lock = Lock()  # 同一时间只允许一个压缩任务
+    _DICT = object()  # _meta_saved中表示该顶层键是按子键记录的字典
+
+    def __init__(self, data_file, compact_threshold=1000):
+        self.data_file = data_file
+        base = os.path.splitext(data_file)[0]
+        self.journal_file = base + '.journal'
+        self.rotated_file = base + '.journal.old'  # 压缩过程中被轮换出的日志
+        self.compact_threshold = compact_threshold
+        self.data = {}
+        self.processed_urls = set()
+        self.history = []
+        self._index = {}  # url -> 历史记录，避免线性查找
+        self.outbox = {}  # 发件箱：id -> 待发送的消息
+        self.dedup = None  # 高水位去重模式下的WatermarkDedup，此时不再维护processed_urls
+        self._journal_count = 0
+        self._compacting = False
+        self._meta_saved = {}  # 键路径 -> 最近一次写入日志（或快照）时的JSON，用于只记录有变化的部分
+        self._signature = None  # 最近一次读写后文件的(mtime, size)
+
+    def load(self):
+        """读取快照并重放日志，快照和日志都不存在时返回False"""
+        with self._file_lock:
+            files = [f for f in (self.data_file, self.rotated_file, self.journal_file) if os.path.exists(f)]
+            if not files:
+                return False
+            snapshot = {}
+            if os.path.exists(self.data_file):
+                with open(self.data_file, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            self.processed_urls = set(snapshot.pop('processed_urls', []))
+            self.history = snapshot.pop('history', [])
+            self.outbox = {item['id']: item for item in snapshot.pop('outbox', [])}
+            dedup_state = snapshot.pop('dedup', None)
+            if self.dedup is not None:
+                self.dedup.load(dedup_state)
+            self._rebuild_index()
+            self.data = snapshot
+            self._journal_count = 0
+            for path in (self.rotated_file, self.journal_file):
+                if os.path.exists(path):
+                    self._journal_count += self._replay(path)
+            # 从历史记录中添加非processing状态的URL（高水位模式下直接查历史记录索引）
+            if self.dedup is None:
+                self.processed_urls.update(
+                    record['url'] for record in self.history
+                    if record.get('status') not in ['processing', None]
+                )
+            self._meta_saved = {}
+            self._changed_meta(self._top_paths())
+            self._signature = self._disk_signature()
+            return True
+
+    def _disk_signature(self):
+        """快照和日志文件的(mtime, size)，用于判断文件是否被外部修改"""
+        signature = []
+        for path in (self.data_file, self.rotated_file, self.journal_file):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def changed_on_disk(self):
+        """文件自上次本实例读写后是否被其他进程或实例修改过"""
+        with self._file_lock:
+            return self._disk_signature() != self._signature
+
+    def _rebuild_index(self):
+        self._index = {}
+        for record in self.history:
+            self._index.setdefault(record['url'], record)
+
+    def _replay(self, path):
+        """按顺序重放一个日志文件，返回记录数"""
+        count = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 进程崩溃时最后一行可能没有写完整，直接丢弃
+                    print(f"跳过损坏的日志记录: {line[:80]}")
+                    continue
+                self._apply(entry)
+                count += 1
+        return count
+
+    def _apply(self, entry):
+        """将一条日志记录应用到内存状态，所有操作都可重复执行"""
+        op = entry.get('op')
+        if op == 'url':
+            self.processed_urls.add(entry['url'])
+        elif op == 'unurl':
+            self.processed_urls.discard(entry['url'])
+        elif op == 'record':
+            record = dict(entry['record'])
+            existing = self._index.get(record['url'])
+            if existing is not None:
+                # 原地更新，保持记录在历史列表中的位置
+                existing.clear()
+                existing.update(record)
+            else:
+                self.history.append(record)
+                self._index[record['url']] = record
+        elif op == 'unrecord':
+            url, status = entry['url'], entry.get('status')
+            existing = self._index.get(url)
+            if existing is None or (status is not None and existing.get('status') != status):
+                return
+            self.history[:] = [
+                h for h in self.history
+                if not (h['url'] == url and (status is None or h.get('status') == status))
+            ]
+            self._index.pop(url, None)
+            for record in self.history:
+                if record['url'] == url:
+                    self._index[url] = record
+                    break
+        elif op == 'meta':
+            if 'data' in entry:
+                # 旧格式的日志记录整个data
+                self.data = entry['data']
+                return
+            *parents, key = entry['path']
+            target = self.data
+            for name in parents:
+                if not isinstance(target.get(name), dict):
+                    target[name] = {}
+                target = target[name]
+            if entry.get('delete'):
+                target.pop(key, None)
+            else:
+                target[key] = entry['value']
+        elif op == 'outbox':
+            self.outbox[entry['item']['id']] = dict(entry['item'])
+        elif op == 'unoutbox':
+            self.outbox.pop(entry['id'], None)
+        elif op == 'seen':
+            if self.dedup is not None:
+                self.dedup.mark(entry['url'], entry.get('lastmod'), entry.get('source'))
+        elif op == 'unseen':
+            if self.dedup is not None:
+                self.dedup.discard(entry['url'])
+        elif op in ('clear', 'clear_seen'):
+            if self.dedup is not None:
+                self.dedup.clear()
+            if op == 'clear':
+                self.processed_urls.clear()
+                self.history.clear()
+                self._index.clear()
+
+    @staticmethod
+    def _dumps(value):
+        """序列化为一行JSON；其他线程恰好在增删键时重试"""
+        for attempt in range(5):
+            try:
+                return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+            except RuntimeError:
+                # dictionary changed size during iteration
+                if attempt == 4:
+                    raise
+
+    def _commit(self, entry):
+        """应用一条变更并追加到日志，日志过长时触发后台压缩"""
+        with self._file_lock:
+            self._apply(entry)
+            need_compact = self._append([self._dumps(entry)])
+        if need_compact:
+            Thread(target=self.compact, name="JournalCompactThread", daemon=True).start()
+
+    def _append(self, lines):
+        """在日志锁内追加若干行，返回是否需要压缩"""
+        # 每次重新以追加模式打开，避免压缩轮换日志后继续写入旧文件
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(''.join(line + '\n' for line in lines))
+        self._journal_count += len(lines)
+        self._signature = self._disk_signature()
+        need_compact = self._journal_count >= self.compact_threshold and not self._compacting
+        if need_compact:
+            self._compacting = True
+        return need_compact
+
+    def add_processed(self, url):
+        """记录已处理的URL"""
+        self._commit({'op': 'url', 'url': url})
+
+    def discard_processed(self, url):
+        """移除已处理的URL"""
+        self._commit({'op': 'unurl', 'url': url})
+
+    def mark_seen(self, url, lastmod=None, source=None):
+        """高水位模式下记录已处理的帖子"""
+        self._commit({'op': 'seen', 'url': url, 'lastmod': lastmod, 'source': source})
+
+    def unmark_seen(self, url):
+        self._commit({'op': 'unseen', 'url': url})
+
+    def clear_seen(self):
+        """清空高水位和最近窗口"""
+        self._commit({'op': 'clear_seen'})
+
+    def is_seen(self, url, lastmod=None, source=None):
+        with self._file_lock:
+            seen = self.dedup.contains(url, lastmod, source)
+            outdated = seen and self.dedup.outdated(url, lastmod)
+        if outdated:
+            # 已处理的帖子被编辑后按新的lastmod重新记录，指纹的保留期从编辑时算起
+            self.mark_seen(url, lastmod, source)
+        return seen
+
+    def upsert_record(self, record):
+        """新增或更新一条历史记录（按URL匹配）"""
+        self._commit({'op': 'record', 'record': dict(record)})
+
+    def remove_record(self, url, status=None):
+        """删除指定URL的历史记录，可限定状态"""
+        self._commit({'op': 'unrecord', 'url': url, 'status': status})
+
+    def clear(self):
+        """清空已处理URL和历史记录"""
+        self._commit({'op': 'clear'})
+
+    def save_meta(self, *paths):
+        """
+        保存设置、统计等除URL和历史记录以外的数据，只把有变化的部分追加到日志
+        paths为已知有变化的键路径（如'statistics'或('sitemap_state', url)），为空时比较全部数据
+        """
+        with self._file_lock:
+            if paths:
+                paths = [(path,) if isinstance(path, str) else tuple(path) for path in paths]
+            else:
+                paths = self._top_paths()
+            lines = self._changed_meta(paths)
+            need_compact = self._append(lines) if lines else False
+        if need_compact:
+            Thread(target=self.compact, name="JournalCompactThread", daemon=True).start()
+
+    def _top_paths(self):
+        return [(key,) for key in self.data] + [
+            (key,) for key in {path[0] for path in self._meta_saved} if key not in self.data
+        ]
+
+    def _changed_meta(self, paths):
+        """
+        比较各键路径的当前值与上次写入的内容，更新记录并返回需要追加的日志行；
+        顶层的字典（源状态、统计等）按第二层的键逐个比较，一个源的变化只写这个源
+        """
+        lines = []
+        for path in paths:
+            found, value = self._lookup(path)
+            if len(path) == 1 and found and isinstance(value, dict):
+                if self._meta_saved.get(path) is not self._DICT:
+                    has_children = any(len(saved) > 1 and saved[0] == path[0] for saved in self._meta_saved)
+                    if self._meta_saved.get(path) is not None or not has_children:
+                        # 新出现的字典（或原来不是字典）：先写入空字典，再逐个写入子键
+                        self._forget(path)
+                        lines.append(f'{{"op":"meta","path":{self._dumps(list(path))},"value":{{}}}}')
+                    self._meta_saved[path] = self._DICT
+                children = [path + (key,) for key in list(value)]
+                children += [
+                    saved for saved in list(self._meta_saved)
+                    if len(saved) == 2 and saved[0] == path[0] and saved[1] not in value
+                ]
+                lines += self._changed_meta(children)
+                continue
+            text = self._dumps(value) if found else None
+            if self._meta_saved.get(path) == text:
+                continue
+            if text is None:
+                self._forget(path)
+                lines.append(self._dumps({'op': 'meta', 'path': list(path), 'delete': True}))
+            else:
+                self._meta_saved[path] = text
+                lines.append(f'{{"op":"meta","path":{self._dumps(list(path))},"value":{text}}}')
+        return lines
+
+    def _forget(self, path):
+        for saved in [saved for saved in self._meta_saved if saved[:len(path)] == path]:
+            del self._meta_saved[saved]
+
+    def _lookup(self, path):
+        """按键路径取data中的值，返回(是否存在, 值)"""
+        value = self.data
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                return False, None
+            value = value[key]
+        return True, value
+
+    def put_outbox(self, item):
+        """新增或更新一条发件箱消息（按id匹配）"""
+        self._commit({'op': 'outbox', 'item': dict(item)})
+
+    def remove_outbox(self, item_id):
+        """从发件箱删除一条消息"""
+        self._commit({'op': 'unoutbox', 'id': item_id})
+
+    def outbox_items(self):
+        with self._file_lock:
+            return [dict(item) for item in self.outbox.values()]
+
+    def is_processed(self, url):
+        return url in self.processed_urls
+
+    def get_record(self, url):
+        """按URL获取历史记录副本，不存在时返回None"""
+        record = self._index.get(url)
+        return dict(record) if record is not None else None
+
+    def records(self):
+        return [dict(record) for record in self.history]
+
+    def processed_count(self):
+        return len(self.processed_urls)
+
+    def iter_processed(self):
+        """遍历已处理URL（返回副本）"""
+        with self._file_lock:
+            return list(self.processed_urls)
+
+    def history_count(self):
+        return len(self.history)
+
+    def recently_processed(self, url, time_window=60):
+        """检查URL的记录时间是否在最近time_window秒内"""
+        record = self._index.get(url)
+        record_time = parse_record_time(record['time']) if record else None
+        if record_time is None:
+            return False
+        return (datetime.now() - record_time).total_seconds() < time_window
+
+    def cleanup_before(self, cutoff_date):
+        """删除早于cutoff_date的历史记录（时间无法解析的保留），返回删除条数"""
+        new_history = []
+        for record in self.history:
+            record_date = parse_record_time(record.get('time'))
+            if record_date is None or record_date > cutoff_date:
+                new_history.append(record)
+        removed = len(self.history) - len(new_history)
+        if removed:
+            self.replace_history(new_history)
+        return removed
+
+    def replace_history(self, history):
+        """整体替换历史记录（用于清理），直接写入新快照"""
+        with self._file_lock:
+            self.history = history
+            self._rebuild_index()
+        self.compact()
+
+    def reset(self, data):
+        """用给定数据重建存储（初始化默认数据时使用）"""
+        with self._file_lock:
+            self.data = {k: v for k, v in data.items() if k not in ('processed_urls', 'history', 'outbox')}
+            self.processed_urls = set(data.get('processed_urls', []))
+            self.history = list(data.get('history', []))
+            self.outbox = {item['id']: item for item in data.get('outbox', [])}
+            if self.dedup is not None:
+                self.dedup.clear()
+            self._meta_saved = {}
+            self._changed_meta(self._top_paths())
+            self._rebuild_index()
+        self.compact()
+
+    def snapshot(self):
+        """生成完整数据快照（在日志锁内调用，设置等数据先复制一份，写文件时不受其他线程修改影响）"""
+        snapshot = json.loads(self._dumps(self.data))
+        snapshot['processed_urls'] = list(self.processed_urls)
+        snapshot['history'] = [dict(record) for record in self.history]
+        snapshot['outbox'] = [dict(item) for item in self.outbox.values()]
+        if self.dedup is not None:
+            snapshot['dedup'] = self.dedup.to_dict()
+        return snapshot
+
+    def compact(self):
+        """将当前状态写为新快照并丢弃已包含在快照中的日志"""
+        try:
+            with self._compact_lock:
+                with self._file_lock:
+                    snapshot = self.snapshot()
+                    if os.path.exists(self.journal_file):
+                        if os.path.exists(self.rotated_file):
+                            # 上次压缩未完成，把新日志接到旧日志后面
+                            with open(self.journal_file, 'r', encoding='utf-8') as src, \
+                                    open(self.rotated_file, 'a', encoding='utf-8') as dst:
+                                shutil.copyfileobj(src, dst)
+                            os.remove(self.journal_file)
+                        else:
+                            os.replace(self.journal_file, self.rotated_file)
+                    self._journal_count = 0
+
+                # 快照写入在日志锁外进行，期间的新变更写入新的日志文件
+                temp_file = self.data_file + '.tmp'
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False, indent=4)
+                os.replace(temp_file, self.data_file)
+                with self._file_lock:
+                    if os.path.exists(self.rotated_file):
+                        os.remove(self.rotated_file)
+                    self._signature = self._disk_signature()
+
+            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"[{current_time}] 数据快照已更新:")
+            print(f"- 已处理URLs数量: {len(snapshot['processed_urls'])}")
+            print(f"- 历史记录数量: {len(snapshot['history'])}")
+        except Exception as e:
+            print(f"压缩数据日志失败: {e}")
+        finally:
+            self._compacting = False
+
+
+class SqliteRecordStore:
+    """
+    SQLite历史记录存储（WAL模式）
+    与JournalStore的历史记录/已处理URL接口一致，去重、最近处理查询和过期清理都走索引
+    """
+
+    _HISTORY_COLUMNS = ('time', 'title', 'author', 'url', 'status')
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._lock = Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS history ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'url TEXT NOT NULL UNIQUE, time TEXT, ts REAL, '
+                'title TEXT, author TEXT, status TEXT)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_history_status ON history(status)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_history_ts ON history(ts)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS processed_urls (url TEXT PRIMARY KEY) WITHOUT ROWID')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+    @staticmethod
+    def _record_ts(record):
+        record_time = parse_record_time(record.get('time'))
+        return record_time.timestamp() if record_time else None
+
+    def _row_to_record(self, row):
+        return {column: row[column] for column in self._HISTORY_COLUMNS}
+
+    def is_processed(self, url):
+        with self._lock:
+            row = self._conn.execute('SELECT 1 FROM processed_urls WHERE url = ?', (url,)).fetchone()
+        return row is not None
+
+    def get_record(self, url):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM history WHERE url = ?', (url,)).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def records(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT * FROM history ORDER BY id').fetchall()
+        return [self._row_to_record(row) for row in rows]
+
+    def processed_count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM processed_urls').fetchone()[0]
+
+    def iter_processed(self, batch=10000):
+        """按主键分批遍历已处理URL，不一次性读入内存"""
+        last = ''
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT url FROM processed_urls WHERE url > ? ORDER BY url LIMIT ?', (last, batch)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row[0]
+            last = rows[-1][0]
+
+    def history_count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM history').fetchone()[0]
+
+    def add_processed(self, url):
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR IGNORE INTO processed_urls (url) VALUES (?)', (url,))
+
+    def discard_processed(self, url):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM processed_urls WHERE url = ?', (url,))
+
+    def upsert_record(self, record):
+        values = [record.get(column) for column in self._HISTORY_COLUMNS] + [self._record_ts(record)]
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO history (time, title, author, url, status, ts) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(url) DO UPDATE SET time = excluded.time, title = excluded.title, '
+                'author = excluded.author, status = excluded.status, ts = excluded.ts',
+                values
+            )
+
+    def remove_record(self, url, status=None):
+        with self._lock, self._conn:
+            if status is None:
+                self._conn.execute('DELETE FROM history WHERE url = ?', (url,))
+            else:
+                self._conn.execute('DELETE FROM history WHERE url = ? AND status = ?', (url, status))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM history')
+            self._conn.execute('DELETE FROM processed_urls')
+
+    def recently_processed(self, url, time_window=60):
+        cutoff = datetime.now().timestamp() - time_window
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM history WHERE url = ? AND ts > ?', (url, cutoff)
+            ).fetchone()
+        return row is not None
+
+    def cleanup_before(self, cutoff_date):
+        with self._lock, self._conn:
+            cursor = self._conn.execute('DELETE FROM history WHERE ts <= ?', (cutoff_date.timestamp(),))
+        return cursor.rowcount
+
+    def is_migrated(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'migrated_from'").fetchone()
+        return row is not None
+
+    def migrate_from(self, store):
+        """从JSON存储一次性导入已处理URL和历史记录"""
+        rows = [
+            [record.get(column) for column in self._HISTORY_COLUMNS] + [self._record_ts(record)]
+            for record in store.history
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO history (time, title, author, url, status, ts) VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO processed_urls (url) VALUES (?)',
+                ((url,) for url in store.processed_urls)
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', ?)",
+                (store.data_file,)
+            )
+        return len(rows)
+
+
+class MonitorEngine:
     """
-    论坛新帖监控插件
-    监控WordPress网站的sitemap,发现新帖时推送通知
-    基础命令：
-    - TS帮助: 显示命令菜单
-    - TS测试: 测试监控和推送功能
-    - TS开启: 开启推送
-    - TS关闭: 关闭推送
-    - TS清理: 清除已处理的URL缓存
-    - TS状态: 查看当前状态
-    - TS间隔 <秒数>: 设置检查间隔时间
-    - TS推送 <URL>: 再次推送指定URL的帖子
-    
-    高级功能：
-    - TS忽略旧帖: 忽略当前时间之前的帖子
-    - TS历史记录: 导出历史推送记录
-    
-    备份功能：
-    - TS备份: 手动备份数据
-    - TS备份设置 开启/关闭: 开启或关闭自动备份
-    - TS备份间隔 <小时>: 设置备份间隔
-    - TS备份数量 <数量>: 设置保留的备份数量
-    
-    重试机制：
-    - TS重试 开启/关闭: 开启或关闭失败重试
-    - TS重试次数 <次数>: 设置最大重试次数
-    - TS重试间隔 <秒数>: 设置重试间隔
-    
-    频率限制：
-    - TS频率 开启/关闭: 开启或关闭推送频率限制
-    - TS频率设置 <次数/分钟>: 设置每分钟最大推送次数
-    
-    时间段设置：
-    - TS时段 开启/关闭: 开启或关闭时间段限制
-    - TS时段设置 <开始时间> <结束时间>: 设置推送时间段(格式:HH:MM)
-    
-    内容过滤：
-    - TS过滤 开启/关闭: 开启或关闭内容过滤
-    - TS过滤词 添加/删除 <关键词>: 管理过滤关键词
-    - TS过滤词列表: 查看所有过滤关键词
-    
-    数据源管理：
-    - TS源 添加 <名称> <URL>: 添加新的sitemap源
-    - TS源 删除 <名称>: 删除指定sitemap源
-    - TS源 列表: 查看所有sitemap源
-    - TS源 开启/关闭 <名称>: 启用或禁用指定源
-    
-    推送模板：
-    - TS模板 添加 <名称> <模板内容>: 添加新的推送模板
-    - TS模板 删除 <名称>: 删除指定模板
-    - TS模板 列表: 查看所有模板
-    - TS模板 设置 <名称>: 设置当前使用的模板
-    
-    分组管理：
-    - TS分组 创建 <名称>: 创建新的推送分组
-    - TS分组 删除 <名称>: 删除指定分组
-    - TS分组 添加 <分组> <群ID/用户ID>: 添加推送对象到分组
-    - TS分组 移除 <分组> <群ID/用户ID>: 从分组移除推送对象
-    - TS分组 列表: 查看所有分组
-    
-    历史记录管理：
-    - TS历史清理 开启/关闭: 开启或关闭自动清理
-    - TS历史天数 <天数>: 设置保留天数
-    - TS历史立即清理: 立即清理过期记录
+    论坛监控引擎（进程内单例）
+    持有数据、后台线程和网络请求，插件实例只负责把命令转发给引擎，
+    避免每条消息都重新加载数据、重复启动线程
     """
-    
-    name = 'Forum_monitor'
-    _data_file = os.path.join(os.path.dirname(__file__), 'data.json')
-    _backup_dir = os.path.join(os.path.dirname(__file__), 'backups')
-    _rate_limit_lock = Lock()
-    _processing_lock = Lock()
-    _check_lock = Lock()  # 添加检查锁
-    _last_push_time = 0
-    _push_count = 0
-    _push_reset_time = 0
-    _retry_queue = []
-    _processing_urls = set()  # 存储正在处理的URL
-    
-    def __init__(self, wcf, msg):
-        super().__init__(wcf, msg)
-        self.last_check_time = 0
-        self._stop_event = Event()
-        self._monitor_thread = None
-        self._backup_thread = None
-        self._retry_thread = None
-        self._cleanup_thread = None
-        self._processed_urls = set()  # 初始化为空集合
-        self._history = []  # 初始化为空列表
-        self._load_data()  # 加载数据
+
+    _instance = None
+    _instance_lock = Lock()
+    POLL_JITTER = 0.1  # 每轮检查间隔上下浮动的比例，避免多个源同时请求
+    ARRIVAL_SAMPLES = 20  # 估计发帖频率时使用的最近帖子数
+    RENDER_CACHE_SIZE = 256  # 缓存的渲染结果条数
+
+    @classmethod
+    def get_instance(cls, wcf, config, data_file, backup_dir):
+        """获取进程内唯一的引擎实例，首次调用时创建"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(wcf, config, data_file, backup_dir)
+            return cls._instance
+
+    def __init__(self, wcf, config, data_file, backup_dir):
+        self.wcf = wcf
+        self.config = config
+        self._data_file = data_file
+        self._backup_dir = backup_dir
+        self._processing_lock = Lock()
+        self._sources_lock = Lock()
+        self._polling_sources = set()  # 正在检查中的源URL
+        self._extractors = {}  # 选择器 -> PostExtractor
+        self._content_filter = (None, None)  # (编译时的词表, ContentFilter)
+        self._filter_lock = Lock()
+        self.filter_hits = defaultdict(int)  # (类别, 词) -> 启动以来的命中次数
+        self._templates = {}  # 模板名 -> 编译后的MessageTemplate
+        self._render_cache = OrderedDict()  # (模板内容, 帖子字段) -> 渲染好的消息
+        self._render_lock = Lock()
+        self._routing = None  # RoutingIndex，分组等设置变化后置空，下次推送时重建
+        self.route_stats = defaultdict(lambda: {'posts': 0, 'sent': 0, 'failed': 0})  # 路由名 -> 推送统计
+        self._source_stats = {}  # 源URL -> 运行状态
+        self._poll_executor = ThreadPoolExecutor(
+            max_workers=self.config.get('poll_workers', 4),
+            thread_name_prefix='SitemapPoll'
+        )
+        self._retry_scheduler = RetryScheduler()
+        self._processing_urls = set()  # 存储正在处理的URL
+        self.sitemap_stats = {'hits': 0, 'misses': 0}  # sitemap条件请求命中（未变化）与未命中次数
+        self.details_stats = {'metadata': 0, 'pages': 0}  # 帖子详情来自元数据与抓取页面的次数
+        self._stats_lock = Lock()  # 轮询、详情和投递线程同时更新上面这些计数
+        self._outbox_lock = Lock()
+        self._outbox_inflight = set()  # 已交给分发器、尚未有结果的发件箱消息id
+        # 监控、备份、重试、清理和发件箱投递都由同一个调度器按到期时间唤醒
+        self.jobs = JobScheduler()
+        self.jobs.register('monitor', self._monitor_job)
+        self.jobs.register('backup', self._backup_job)
+        self.jobs.register('retry', self._retry_job)
+        self.jobs.register('cleanup', self._cleanup_job)
+        self.jobs.register('outbox', self._outbox_job)
+        self.http = FetchClient.from_config(self.config.get('http'))
+        # sitemap与帖子详情都经由异步抓取引擎并发请求，未安装aiohttp时由它退回self.http
+        self.fetcher = AsyncFetcher.from_config(self.http, self.config.get('http'))
+        self.dispatcher = DeliveryDispatcher.from_config(
+            lambda message, receiver: self.wcf.send_text(message, receiver, None),
+            self.config.get('delivery')
+        )
+        cache = self.config.get('details_cache') or {}
+        self.details_cache = DetailsCache(
+            max_entries=cache.get('max_entries', 500),
+            ttl=cache.get('ttl', 3600),
+            cache_file=os.path.join(os.path.dirname(self._data_file), 'details_cache.json') if cache.get('persist') else None,
+        )
+        storage = self.config.get('storage') or {}
+        self.store = JournalStore(self._data_file, storage.get('compact_threshold', 1000))
+        dedup = self.config.get('dedup') or {}
+        if dedup.get('mode') == 'watermark':
+            self.store.dedup = WatermarkDedup(
+                dedup.get('window', 2000), dedup.get('grace', 86400), dedup.get('retention', 604800)
+            )
+        # 历史记录和已处理URL默认随data.json保存，可选改用SQLite
+        self.records = self.store
+        if storage.get('backend') == 'sqlite':
+            db_file = os.path.join(os.path.dirname(self._data_file), storage.get('sqlite_file', 'data.db'))
+            self.records = SqliteRecordStore(db_file)
+        # 可选的布隆过滤器，挡在已处理URL的精确存储前面（高水位去重只存窗口和指纹，不需要）
+        bloom = self.config.get('bloom') or {}
+        self.bloom = None
+        self._data_loaded = False
+        if bloom.get('enabled') and self.store.dedup is None:
+            bloom_file = os.path.join(os.path.dirname(self._data_file), bloom.get('file', 'processed.bloom'))
+            self.bloom = BloomFilter(bloom_file, bloom.get('capacity', 1000000), bloom.get('error_rate', 0.001))
         os.makedirs(self._backup_dir, exist_ok=True)
+        self.load_data()  # 加载数据
         self._start_background_tasks()
+        atexit.register(self.shutdown)
+
+    def update_config(self, wcf, config):
+        """插件重新读取配置后同步给引擎，检查间隔以持久化数据为准"""
+        config['monitor_interval'] = self.data['settings']['monitor_interval']
+        self.wcf = wcf
+        if any(config.get(key) != self.config.get(key) for key in ('notify_groups', 'notify_users')):
+            self._routing = None
+        self.config = config
+
+    def shutdown(self):
+        """停止调度器和所有后台线程并把变更日志合并进快照"""
+        try:
+            self.jobs.stop()
+            self._poll_executor.shutdown(wait=False)
+            self.fetcher.close()
+            self.details_cache.save()
+            # 尽量把已排队的消息发出去
+            self.dispatcher.drain(timeout=10)
+            self.dispatcher.close()
+            self.store.compact()
+            if self.bloom is not None:
+                self.bloom.close()
+        except Exception as e:
+            print(f"引擎关闭错误: {e}")
 
     def _start_background_tasks(self):
         """启动后台任务"""
         try:
-            # 启动备份线程
+            # 推送开关在上次运行时处于开启状态，直接恢复监控
+            if self.is_running:
+                self.start_monitor()
+
+            # 安排自动备份
             if self.data['settings']['backup']['enabled']:
-                self._start_backup_thread()
+                self.start_backup_job()
             
-            # 启动重试线程
+            # 安排失败重试
             if self.data['settings']['retry']['enabled']:
-                self._start_retry_thread()
+                self.start_retry_job()
                 
-            # 启动清理线程
+            # 安排历史记录清理
             if self.data['settings']['history_cleanup']['enabled']:
-                self._start_cleanup_thread()
+                self.start_cleanup_job()
+
+            # 补发上次退出前未送达的消息
+            self.jobs.schedule('outbox')
         except Exception as e:
             print(f"启动后台任务失败: {e}")
 
-    def _load_data(self):
-        """加载持久化数据"""
+    @property
+    def data(self):
+        """设置、统计等持久化数据"""
+        return self.store.data
+
+    def load_data(self):
+        """加载持久化数据（快照 + 变更日志）"""
+        # 重新加载（TS重载、文件被外部修改）时已处理URL可能已变，布隆过滤器按新数据重建；启动时沿用持久化的过滤器
+        if self.bloom is not None and self._data_loaded:
+            self.bloom.stale = True
+        self._data_loaded = True
         try:
-            if os.path.exists(self._data_file):
-                with open(self._data_file, 'r', encoding='utf-8') as f:
-                    self.data = json.load(f)
-                    # 从data中加载已处理的URLs
-                    self._processed_urls = set(self.data.get('processed_urls', []))
-                    # 从历史记录中添加非processing状态的URL
-                    self._processed_urls.update(
-                        record['url'] for record in self.data.get('history', [])
-                        if record.get('status') not in ['processing', None]
-                    )
-                    self._history = self.data.get('history', [])
-                    settings = self.data.get('settings', {})
-                    self._is_running = settings.get('is_running', False)
-                    self._ignore_old = settings.get('ignore_old', False)
-                    # 确保monitor_interval从settings中加载
-                    self.data['settings']['monitor_interval'] = settings.get('monitor_interval', 60)
-                    self.config['monitor_interval'] = self.data['settings']['monitor_interval']
-                    
-                    # 打印加载状态
-                    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    print(f"[{current_time}] 数据加载完成:")
-                    print(f"- 已处理URLs数量: {len(self._processed_urls)}")
-                    print(f"- 历史记录数量: {len(self._history)}")
-                    print(f"- 检查间隔: {self.data['settings']['monitor_interval']}秒")
+            if self.store.load():
+                self._migrate_records()
+                self._migrate_dedup()
+                self._sync_bloom()
+                settings = self.data.get('settings', {})
+                self.is_running = settings.get('is_running', False)
+                self.ignore_old = settings.get('ignore_old', False)
+                # 确保monitor_interval从settings中加载
+                self.data['settings']['monitor_interval'] = settings.get('monitor_interval', 60)
+                self.config['monitor_interval'] = self.data['settings']['monitor_interval']
+                
+                # 打印加载状态
+                current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                print(f"[{current_time}] 数据加载完成:")
+                print(f"- 已处理URLs数量: {self.processed_count()}")
+                print(f"- 历史记录数量: {self.records.history_count()}")
+                print(f"- 检查间隔: {self.data['settings']['monitor_interval']}秒")
             else:
                 self._init_default_data()
         except Exception as e:
             print(f"加载数据失败: {e}")
             self._init_default_data()
+        self._routing = None
+        self.update_rate_limit()
+
+    def _reload_if_changed(self):
+        """数据文件被外部修改时重新加载，返回是否发生了重新加载"""
+        if not self.store.changed_on_disk():
+            return False
+        print("检测到数据文件被外部修改，重新加载")
+        self.load_data()
+        return True
+
+    def _migrate_records(self):
+        """首次启用SQLite存储时，从data.json一次性迁移历史记录和已处理URL"""
+        if self.records is self.store or self.records.is_migrated():
+            return
+        count = self.records.migrate_from(self.store)
+        if self.store.history or self.store.processed_urls:
+            # 迁移前保留一份完整备份，再把JSON中的记录清空
+            self.create_backup()
+            self.store.clear()
+            self.store.compact()
+        print(f"已迁移 {count} 条历史记录到 {self.records.db_file}")
+
+    def _migrate_dedup(self):
+        """
+        首次启用高水位去重时，由已处理URL和历史记录生成各源的高水位与最近窗口，
+        之后快照中不再保存完整的已处理URL列表
+        """
+        store = self.store
+        if store.dedup is None or store.dedup.recent or not (store.processed_urls or self.records.history_count()):
+            return
+        self.create_backup()
+        china_tz = pytz.timezone('Asia/Shanghai')
+        source_by_host = {urlsplit(source['url']).netloc: source['url'] for source in self.sources()}
+        history_urls = {record['url'] for record in self.records.records()}
+        # 没有历史记录的URL不知道时间，先放入窗口，随后按时间放入的历史记录更新
+        for url in store.processed_urls - history_urls:
+            store.dedup.mark(url)
+        records = []
+        for record in self.records.records():
+            record_time = parse_record_time(record.get('time'))
+            if record.get('status') not in ['processing', None]:
+                records.append((record_time or datetime.min, record['url']))
+        for record_time, url in sorted(records):
+            lastmod = china_tz.localize(record_time).isoformat() if record_time != datetime.min else None
+            store.dedup.mark(url, lastmod, source_by_host.get(urlsplit(url).netloc))
+        count = len(store.processed_urls)
+        store.processed_urls.clear()
+        store.compact()
+        print(f"已将 {count} 条已处理URL迁移为高水位去重（保留最近 {len(store.dedup.recent)} 条）")
+
+    def _sync_bloom(self):
+        """布隆过滤器新建、参数变化或上次未正常关闭时由精确存储重建；已处理URL超出容量时按两倍扩容"""
+        bloom = self.bloom
+        if bloom is None:
+            return
+        count = self.records.processed_count()
+        if count > bloom.capacity:
+            bloom.close()
+            self.bloom = bloom = BloomFilter(bloom.path, count * 2, bloom.error_rate)
+        if not bloom.stale:
+            return
+        bloom.clear()
+        bloom.update(self.records.iter_processed())
+        bloom.stale = False
+        bloom.flush()
+        print(f"已重建布隆过滤器：{count} 条已处理URL，占用 {bloom.size_bytes() / 1024 / 1024:.1f}MB")
 
     def _init_default_data(self):
         """初始化默认数据"""
-        self.data = {
+        default_data = {
             'processed_urls': [],
             'history': [],
             'settings': {
@@ -204,7 +2425,7 @@ class Forum_monitor(Plugin):
             },
             'sitemaps': [
                 {
-                    'name': '默认论坛',
+                    'name': DEFAULT_SOURCE_NAME,
                     'url': self.config.get('sitemap_url'),
                     'enabled': True
                 }
@@ -222,102 +2443,170 @@ class Forum_monitor(Plugin):
                 'custom': {}
             }
         }
-        self._processed_urls = set()
-        self._history = []
-        self._is_running = False
-        self._ignore_old = False
-        self._save_data()
-
-    def _save_data(self):
-        """保存数据到文件"""
+        self.store.reset(default_data)
+        self.is_running = False
+        self.ignore_old = False
+
+    def save_data(self, *paths):
+        """
+        保存设置等数据（只把有变化的部分追加到日志，不再重写整个文件）
+        paths为已知有变化的键路径，后台统计、校验信息等只保存这一部分；命令修改后不带参数调用
+        """
         try:
-            # 确保processed_urls是从_processed_urls集合转换而来
-            self.data['processed_urls'] = list(self._processed_urls)
-            # 确保历史记录被正确保存
-            self.data['history'] = self._history
-            # 保存所有设置
             self.data['settings'].update({
-                'is_running': self._is_running,
-                'ignore_old': self._ignore_old,
+                'is_running': self.is_running,
+                'ignore_old': self.ignore_old,
                 'monitor_interval': self.config.get('monitor_interval', 60)
             })
-            
-            # 使用临时文件进行安全保存
-            temp_file = self._data_file + '.tmp'
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=4)
-            # 安全地替换原文件
-            shutil.move(temp_file, self._data_file)
-            
-            # 打印保存状态（调试用）
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"[{current_time}] 数据已保存:")
-            print(f"- 已处理URLs数量: {len(self._processed_urls)}")
-            print(f"- 历史记录数量: {len(self._history)}")
-            print(f"- 检查间隔: {self.data['settings']['monitor_interval']}秒")
-            
+            if paths:
+                self.store.save_meta('settings', *paths)
+                return
+            self.store.save_meta()
+            # 分组、推送列表等只在命令修改后保存，借此让路由索引在下次推送时重建
+            self._routing = None
         except Exception as e:
             print(f"保存数据失败: {e}")
-            # Retry saving data if an error occurs
-            try:
-                with open(self._data_file, 'w', encoding='utf-8') as f:
-                    json.dump(self.data, f, ensure_ascii=False, indent=4)
-            except Exception as retry_e:
-                print(f"重试保存数据失败: {retry_e}")
-
-    def _start_monitor_thread(self):
-        """启动监控线程"""
-        if self._monitor_thread is None or not self._monitor_thread.is_alive():
-            self._stop_event.clear()
-            self._monitor_thread = Thread(target=self._monitor_loop, name="ForumMonitorThread", daemon=True)
-            self._monitor_thread.start()
+
+    def start_monitor(self):
+        """立即安排一次监控，之后按下一个源的到期时间继续；间隔或数据源变化后调用即可立即生效"""
+        self.jobs.schedule('monitor')
             
-    def _stop_monitor_thread(self):
-        """停止监控线程"""
-        if self._monitor_thread and self._monitor_thread.is_alive():
-            self._stop_event.set()
-            self._monitor_thread.join(timeout=1)
+    def stop_monitor(self):
+        """取消后续的监控"""
+        self.jobs.cancel('monitor')
             
-    def _monitor_loop(self):
-        """监控循环"""
-        last_check_time = time.time()
-        try:
-            while not self._stop_event.is_set():
-                if self._is_running:
-                    current_time = time.time()
-                    # 确保距离上次检查至少间隔指定的时间
-                    if current_time - last_check_time >= self.data['settings']['monitor_interval']:
-                        self.check_sitemap()
-                        last_check_time = current_time
-                
-                # 使用较长的睡眠时间，以便能够准确控制检查间隔
-                time.sleep(self.data['settings']['monitor_interval'] / 2)
-        except Exception as e:
-            print(f"监控循环错误: {e}")
+    def _monitor_job(self):
+        """分发到期的源，返回距离下一个源到期的秒数"""
+        if not self.is_running:
+            return None
+        self.check_sitemap()
+        return self._next_poll_delay()
             
-    def get_post_details(self, url):
+    def get_post_details(self, url, source=None):
         """从帖子URL获取详细信息"""
-        try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        return self._submit_post_details(url, source)()
+
+    def _extractor_for(self, source=None):
+        """按config.yaml的selectors及源自身的selectors取得提取器"""
+        selectors = dict(self.config.get('selectors') or {}, **((source or {}).get('selectors') or {}))
+        key = tuple(sorted(selectors.items()))
+        extractor = self._extractors.get(key)
+        if extractor is None:
+            extractor = self._extractors[key] = PostExtractor(selectors)
+        return extractor
+
+    def _metadata_sources(self, source=None):
+        """源自身设置的元数据来源，未设置时使用config.yaml中的metadata"""
+        names = (source or {}).get('metadata')
+        if names is None:
+            names = self.config.get('metadata') or []
+        return [name for name in names if name in METADATA_SOURCES]
+
+    def _batch_metadata(self, urls, source=None, titles=None):
+        """
+        按元数据来源依次批量获取帖子的标题和作者，每种来源最多一次请求，
+        返回 url -> {'title', 'author'}，缺失的字段由调用方抓取页面补齐
+        """
+        found = {url: {} for url in urls}
+        for name in self._metadata_sources(source):
+            missing = [url for url, meta in found.items() if not (meta.get('title') and meta.get('author'))]
+            if not missing:
+                break
+            try:
+                if name == 'sitemap':
+                    data = {url: {'title': title} for url, title in (titles or {}).items()}
+                elif name == 'rss':
+                    data = self._rss_metadata(source)
+                else:
+                    data = self._wp_metadata(source, len(missing))
+            except (requests.RequestException, ET.ParseError, ValueError, KeyError, TypeError) as e:
+                print(f"通过{name}获取帖子详情失败: {e}")
+                continue
+            data = {url.rstrip('/'): meta for url, meta in data.items()}
+            for url in missing:
+                for field, value in data.get(url.rstrip('/'), {}).items():
+                    if value and not found[url].get(field):
+                        found[url][field] = value
+        return found
+
+    def _site_root(self, source):
+        parts = urlsplit(source['url'])
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _rss_metadata(self, source):
+        """从站点的RSS（/feed/）读取最近帖子的标题和作者"""
+        result = self.fetcher.fetch_text(self._site_root(source) + '/feed/', timeout=source.get('timeout'))
+        data = {}
+        for item in ET.fromstring(result.text.encode('utf-8')).iter('item'):
+            link = (item.findtext('link') or '').strip()
+            if link:
+                data[link] = {
+                    'title': (item.findtext('title') or '').strip(),
+                    'author': (item.findtext(DC_NS + 'creator') or '').strip(),
+                }
+        return data
+
+    def _wp_metadata(self, source, count):
+        """通过WordPress REST API批量读取最近帖子的标题和作者，作者名再用一次users请求换取"""
+        root = self._site_root(source)
+        timeout = source.get('timeout')
+        result = self.fetcher.fetch_text(
+            f"{root}/wp-json/wp/v2/posts?per_page={min(max(count, 10), 100)}&_fields=link,title,author",
+            timeout=timeout
+        )
+        posts = json.loads(result.text)
+        authors = {}
+        author_ids = sorted({post['author'] for post in posts if post.get('author')})
+        if author_ids:
+            try:
+                result = self.fetcher.fetch_text(
+                    f"{root}/wp-json/wp/v2/users?include={','.join(map(str, author_ids))}"
+                    f"&per_page=100&_fields=id,name",
+                    timeout=timeout
+                )
+                authors = {user['id']: user['name'] for user in json.loads(result.text)}
+            except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+                # 不少站点关闭了users接口，此时作者由帖子页面补齐
+                print(f"通过wp-json获取作者失败: {e}")
+        return {
+            post['link']: {
+                'title': unescape(post['title']['rendered']).strip(),
+                'author': authors.get(post.get('author')),
             }
-            response = requests.get(url, headers=headers, timeout=10)
-            response.encoding = 'utf-8'
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 获取标题 - 直接获取h1.article-title下的a标签的title属性
-            title = None
-            title_link = soup.select_one('h1.article-title a')
-            if title_link:
-                title = title_link.get('title')  # 获取title属性值
-            
-            # 获取作者
-            author = None
-            author_elem = soup.select_one('.meta-left .display-name')
-            if author_elem:
-                author = author_elem.text.strip()
-            
-            return title or "获取失败", author or "获取失败"
+            for post in posts
+        }
+
+    def _submit_post_details(self, url, source=None, known=None):
+        """
+        提交帖子详情的获取，返回等待结果的函数
+        缓存未过期时直接使用；否则抓取页面（缓存过期时带校验信息条件请求），边下载边提取，取到后即停止读取
+        """
+        known = known or {}
+        cached, fresh = self.details_cache.get(url)
+        if fresh:
+            return lambda: (known.get('title') or cached['title'], known.get('author') or cached['author'])
+        extraction = self._extractor_for(source).session()
+        future = self.fetcher.submit_stream(
+            url, extraction.feed, headers=self._conditional_headers(cached or {}), on_close=extraction.close
+        )
+        return partial(self._read_post_details, url, future, extraction, cached, known)
+
+    def _read_post_details(self, url, future, extraction, cached=None, known=None):
+        """等待帖子页面抓取完成，返回提取出的标题和作者，known中已有的字段优先"""
+        known = known or {}
+        try:
+            response = future.result()
+            if response.status_code == 304 and cached:
+                self.details_cache.revalidate(url)
+                title, author = cached['title'], cached['author']
+            else:
+                title, author = extraction.result()
+                if title and author:
+                    self.details_cache.put(
+                        url, title, author,
+                        response.headers.get('ETag'), response.headers.get('Last-Modified')
+                    )
+            return known.get('title') or title or "获取失败", known.get('author') or author or "获取失败"
         except Exception as e:
             print(f"获取帖子详情失败: {e}")
             return "获取失败", "获取失败"
@@ -331,81 +2620,187 @@ class Forum_monitor(Plugin):
             china_tz = pytz.timezone('Asia/Shanghai')
             dt = dt.astimezone(china_tz)
             # 格式化输出
-            return dt.strftime('%Y年%m月%d日 %H:%M:%S')
+            return dt.strftime(RECORD_TIME_FORMAT)
         except Exception as e:
             print(f"时间转换失败: {e}")
             return time_str
             
-    def _check_rate_limit(self):
-        """检查推送频率限制"""
-        with self._rate_limit_lock:
-            current_time = time.time()
-            # 如果已经过了一分钟，重置计数器
-            if current_time - self._push_reset_time >= 60:
-                self._push_count = 0
-                self._push_reset_time = current_time
-
-            # 检查是否超过频率限制
-            if self.data['settings']['rate_limit']['enabled']:
-                max_per_minute = self.data['settings']['rate_limit']['max_per_minute']
-                if self._push_count >= max_per_minute:
-                    return False
-                
-            self._push_count += 1
-            return True
+    def update_rate_limit(self):
+        """把TS频率的设置同步到发送限速器（每分钟条数换算为每秒速率）"""
+        rate_limit = self.data.get('settings', {}).get('rate_limit') or {}
+        per_minute = rate_limit.get('max_per_minute', 10) if rate_limit.get('enabled') else 0
+        self.dispatcher.limiter.set_rate(per_minute / 60)
 
-    def process_post(self, url, lastmod=None, force=False):
+    def process_post(self, url, lastmod=None, force=False, source=None):
         """处理帖子"""
+        if not self._claim_post(url, lastmod, force):
+            return False
+        return self._deliver_post(url, lastmod, lambda: self.get_post_details(url, source), force, source)
+
+    def _process_batch(self, urls, source=None, titles=None):
+        """
+        处理一轮发现的新帖子：先按源的元数据来源批量获取标题和作者，
+        缺失的再由抓取引擎并发获取详情页，推送按lastmod从旧到新依次进行，返回成功推送的数量
+        """
+        claimed = []
+        for loc, lastmod in sorted(urls, key=lambda x: x[1]):
+            if self._claim_post(loc, lastmod):
+                claimed.append((loc, lastmod))
+            else:
+                with self._processing_lock:
+                    self._processing_urls.discard(loc)
+
+        metadata = self._batch_metadata([loc for loc, _ in claimed], source, titles or {})
+        pending = []
+        for loc, lastmod in claimed:
+            known = metadata.get(loc, {})
+            if known.get('title') and known.get('author'):
+                self._count(self.details_stats, 'metadata')
+                self.details_cache.put(loc, known['title'], known['author'])
+                pending.append((loc, lastmod, lambda known=known: (known['title'], known['author'])))
+            else:
+                self._count(self.details_stats, 'pages')
+                pending.append((loc, lastmod, self._submit_post_details(loc, source, known)))
+
+        succeeded = 0
+        for loc, lastmod, get_details in pending:
+            # 按顺序等待，后面的帖子详情在此期间继续并发获取
+            if self._deliver_post(loc, lastmod, get_details, source=source):
+                succeeded += 1
+            else:
+                self._schedule_retry(loc, lastmod)
+        return succeeded
+
+    def _schedule_retry(self, url, lastmod=None, attempts=0):
+        """开启失败重试时把处理失败的帖子交给重试调度器，返回是否已安排"""
+        retry = self.data['settings']['retry']
+        if not retry['enabled']:
+            return False
+        if attempts >= retry['max_attempts']:
+            self._count(self.data['statistics'], 'failed_pushes')
+            self.save_data('statistics')
+            return False
+        self._retry_scheduler.schedule(url, lastmod, attempts, base_delay=retry['delay'])
+        self.jobs.schedule('retry', self._retry_delay(), earlier_only=True)
+        return True
+
+    def content_filter(self):
+        """按当前词表编译的内容过滤器，词表变化（命令修改或重新加载数据）后自动重新编译"""
+        settings = self.data['settings']['content_filter']
+        words = tuple(tuple(settings.get(kind, [])) for kind in ContentFilter.KINDS)
+        compiled_words, content_filter = self._content_filter
+        if compiled_words != words:
+            content_filter = ContentFilter(*words)
+            self._content_filter = (words, content_filter)
+        return content_filter
+
+    def _passes_filter(self, *texts):
+        """未开启内容过滤或判断为推送时返回True，并累计各词的命中次数"""
+        if not self.data['settings']['content_filter'].get('enabled'):
+            return True
+        allowed, hits = self.content_filter().check(*texts)
+        with self._filter_lock:
+            for kind, words in hits.items():
+                for word in words:
+                    self.filter_hits[(kind, word)] += 1
+        return allowed
+
+    def is_processed(self, url, lastmod=None, source=None):
+        """
+        帖子是否已处理过；高水位模式下查最近窗口、源的高水位和历史记录，
+        source为检查中的源（不知道时只查窗口和历史记录）
+        """
+        if self.store.dedup is None:
+            # 不在布隆过滤器中的一定未处理，不必查精确存储
+            if self.bloom is not None and url not in self.bloom:
+                return False
+            return self.records.is_processed(url)
+        if self.store.is_seen(url, lastmod, source['url'] if source else None):
+            return True
+        record = self.records.get_record(url)
+        return record is not None and record.get('status') not in ['processing', None]
+
+    def _mark_processed(self, url, lastmod=None, source=None):
+        if self.store.dedup is None:
+            # 先写过滤器，保证精确存储中有的URL过滤器里一定有
+            if self.bloom is not None:
+                self.bloom.add(url)
+            self.records.add_processed(url)
+        else:
+            self.store.mark_seen(url, lastmod, source['url'] if source else None)
+
+    def _unmark_processed(self, url):
+        if self.store.dedup is None:
+            self.records.discard_processed(url)
+        else:
+            self.store.unmark_seen(url)
+
+    def processed_count(self):
+        """已处理URL数，高水位模式下为最近窗口与指纹的条数"""
+        if self.store.dedup is None:
+            return self.records.processed_count()
+        return len(self.store.dedup)
+
+    def _claim_post(self, url, lastmod=None, force=False):
+        """检查帖子状态并登记为处理中，已处理或正在处理时返回False"""
         with self._processing_lock:
             # 检查帖子状态
-            for record in self._history:
-                if record['url'] == url:
-                    if record['status'] in ['processing', 'completed'] and not force:
-                        print(f"[跳过] 已处理的URL: {url}")
-                        return False
-                    # 更新状态为processing
-                    record['status'] = 'processing'
-                    break
+            record = self.records.get_record(url)
+            if record:
+                if record['status'] in ['processing', 'completed', 'filtered'] and not force:
+                    print(f"[跳过] 已处理的URL: {url}")
+                    return False
+                # 更新状态为processing
+                self.records.upsert_record(dict(record, status='processing'))
             else:
                 # 如果没有找到，添加新的记录
                 china_time = self.convert_time(lastmod)
-                self._history.append({
+                self.records.upsert_record({
                     'time': china_time,
                     'title': '处理中...',
                     'author': '处理中...',
                     'url': url,
                     'status': 'processing'
                 })
-            self._save_data()
+        return True
 
+    def _deliver_post(self, url, lastmod, get_details, force=False, source=None):
+        """获取详情（get_details）、推送并更新记录，失败时清理处理中状态；force为手动推送，不经内容过滤"""
         success = False
         try:
             # 获取帖子详情
-            title, author = self.get_post_details(url)
+            title, author = get_details()
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            if not force and not self._passes_filter(title, author):
+                # 被过滤的帖子同样记为已处理，之后不再重复检查
+                with self._processing_lock:
+                    record = self.records.get_record(url)
+                    if record:
+                        self.records.upsert_record(dict(record, title=title, author=author, status='filtered'))
+                    self._mark_processed(url, lastmod, source)
+                print(f"[{current_time}] 🚫 内容过滤跳过帖子: {title} ({url})")
+                success = True
+                return True
             print(f"[{current_time}] 准备处理帖子: {title} ({url})")
             
             # 使用XML中的时间
             china_time = self.convert_time(lastmod) if lastmod else self.convert_time(datetime.now(pytz.UTC).isoformat())
+            post = {'title': title, 'author': author, 'time': china_time, 'url': url}
             
-            # 构建消息
-            message = self._format_message(title, author, china_time, url)
-            
-            # 发送通知
-            self.send_notifications(message)
+            # 按接收者使用的模板渲染并发送通知（入队后立即返回，不等待各接收者发送完成）
+            self.send_notifications(post, source)
 
             # 更新历史记录和处理状态
             with self._processing_lock:
-                for record in self._history:
-                    if record['url'] == url:
-                        record.update({
-                            'title': title,
-                            'author': author,
-                            'status': 'completed'
-                        })
-                        break
-                self._processed_urls.add(url)
-                self._save_data()
+                record = self.records.get_record(url)
+                if record:
+                    self.records.upsert_record(dict(
+                        record,
+                        title=title,
+                        author=author,
+                        status='completed'
+                    ))
+                self._mark_processed(url, lastmod, source)
             
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             print(f"[{current_time}] ✅ 成功推送帖子: {title}")
@@ -415,195 +2810,729 @@ class Forum_monitor(Plugin):
         except Exception as e:
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             print(f"[{current_time}] 处理帖子失败: {e}")
-            # 如果处理失败，清理所有相关状态
-            with self._processing_lock:
-                self._history[:] = [h for h in self._history if not (h['url'] == url and h['status'] == 'processing')]
-                self._processed_urls.discard(url)
-                self._save_data()
             return False
             
         finally:
             with self._processing_lock:
                 self._processing_urls.discard(url)
                 if not success:
-                    self._history[:] = [h for h in self._history if not (h['url'] == url and h['status'] == 'processing')]
-                    self._processed_urls.discard(url)
-                    self._save_data()
+                    # 如果处理失败，清理所有相关状态
+                    self.records.remove_record(url, status='processing')
+                    self._unmark_processed(url)
+
+    def check_sitemap(self, is_test=False, reply_to=None):
+        """
+        检查sitemap获取新帖子，reply_to为测试模式下接收错误信息的ID
+        正常模式下把到期的源交给轮询线程池并发检查后立即返回，单个源变慢不会拖住其他源；
+        测试模式同步拉取所有源并强制推送其中最新的一条
+        """
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"\n[{current_time}] {'[测试模式]' if is_test else '[正常模式]'} 开始检查sitemap")
+
+        try:
+            # 内存中的数据为准，仅当数据文件被外部修改时才重新加载
+            self._reload_if_changed()
+            
+            print(f"[{current_time}] 当前状态:")
+            print(f"- 处理中URLs数量: {len(self._processing_urls)}")
+            print(f"- 已处理URLs数量: {self.processed_count()}")
+            print(f"- 历史记录数量: {self.records.history_count()}")
+            print(f"- 重试队列数量: {len(self._retry_scheduler)}")
+
+            if is_test:
+                self._test_sources()
+                return
+
+            for source in self._due_sources():
+                with self._sources_lock:
+                    # 上一轮检查还没结束的源跳过本轮
+                    if source['url'] in self._polling_sources:
+                        print(f"[{current_time}] 数据源 {source['name']} 的上一次检查仍在进行，跳过")
+                        continue
+                    self._polling_sources.add(source['url'])
+                status = self.source_status(source['url'])
+                status['last_check'] = time.time()
+                status['jitter'] = random.uniform(1 - self.POLL_JITTER, 1 + self.POLL_JITTER)
+                self._poll_executor.submit(self._check_source, source)
+            
+        except Exception as e:
+            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            error_msg = f"[{current_time}] 检查sitemap出错: {e}"
+            print(error_msg)
+            if is_test and reply_to:
+                self.wcf.send_text(error_msg, reply_to, None)
+
+    def _test_sources(self):
+        """测试模式：并发完整拉取所有源，强制推送最新的一条"""
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        sources = self.sources()
+        if not sources:
+            print(f"[{current_time}] 没有可用的数据源")
+            return
+        results = self._poll_executor.map(lambda source: self._fetch_sitemap(source, {}), sources)
+        urls = [(entry, source) for source, result in zip(sources, results) if result for entry in result[0]]
+        if not urls:
+            print(f"[{current_time}] 没有新的帖子需要处理")
+            return
+        (loc, lastmod), source = max(urls, key=lambda x: x[0][1])
+        print(f"[{current_time}] 测试模式：处理最新的帖子")
+        self.process_post(loc, lastmod, force=True, source=source)
+
+    def _check_source(self, source):
+        """在轮询线程中检查单个源，新帖子并入共享的已处理集合后处理"""
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        sitemap_url = source['url']
+        status = self.source_status(sitemap_url)
+        try:
+            # 带上次的校验信息做条件请求
+            state = self._sitemap_state(sitemap_url)
+            try:
+                result = self._fetch_sitemap(source, state)
+            except (requests.RequestException, ET.ParseError) as e:
+                status['failures'] += 1
+                status['total_failures'] += 1
+                status['last_error'] = str(e)
+                print(f"[{current_time}] 获取或解析数据源 {source['name']} 失败: {e}")
+                self._adapt_interval(source, error=e)
+                return
+            status['failures'] = 0
+            status['last_success'] = time.time()
+
+            if result is None:
+                self._count(self.sitemap_stats, 'hits')
+                print(f"[{current_time}] 数据源 {source['name']} 未变化，跳过解析")
+                self._adapt_interval(source)
+                return
+            entries, validators, titles = result
+            self._count(self.sitemap_stats, 'misses')
+
+            # 在处理锁内去重，并登记为处理中，避免多个源同时拿到同一个URL
+            urls = []
+            retrying = False  # 有帖子在等待重试时不记录校验信息，重启后仍能重新发现它们
+            with self._processing_lock:
+                for loc, lastmod in entries:
+                    # 检查是否已经在历史记录中（包括所有状态）
+                    if self.is_processed(loc, lastmod, source):
+                        continue
+                    # 检查是否在处理中或重试队列中
+                    if loc in self._retry_scheduler:
+                        retrying = True
+                        continue
+                    if loc in self._processing_urls:
+                        print(f"[{current_time}] 跳过处理中的URL: {loc}")
+                        continue
+                    urls.append((loc, lastmod))
+                self._adapt_interval(source, [lastmod for _, lastmod in entries], has_new=bool(urls))
+
+                # 如果没有新的URL，直接返回
+                if not urls:
+                    print(f"[{current_time}] 数据源 {source['name']} 没有新的帖子需要处理")
+                    if not retrying:
+                        self._save_sitemap_state(sitemap_url, validators)
+                    return
+                if not self.is_running:
+                    return
+
+                # 忽略旧帖时，早于忽略时间的帖子不推送，也不再阻止记录校验信息
+                urls = [(loc, lastmod) for loc, lastmod in urls if not self._is_ignored(lastmod)]
+                if not urls:
+                    print(f"[{current_time}] 跳过旧帖子")
+                    if not retrying:
+                        self._save_sitemap_state(sitemap_url, validators)
+                    return
+
+                # 从旧到新取本轮处理的帖子，超出上限的留到下一轮
+                urls.sort(key=lambda x: x[1])
+                max_per_cycle = (self.config.get('pipeline') or {}).get('max_per_cycle', 50)
+                batch = urls[:max_per_cycle]
+                for loc, _ in batch:
+                    self._processing_urls.add(loc)
+
+            print(f"[{current_time}] 数据源 {source['name']} 找到 {len(urls)} 个新帖子，本轮处理 {len(batch)} 个")
+            succeeded = self._process_batch(batch, source, titles)
+            # 仍有新帖未处理或处理失败时不能记录校验信息，否则下轮会被当作未变化跳过
+            if succeeded == len(urls) and not retrying:
+                self._save_sitemap_state(sitemap_url, validators)
+        except Exception as e:
+            print(f"[{current_time}] 检查数据源 {source['name']} 出错: {e}")
+        finally:
+            with self._sources_lock:
+                self._polling_sources.discard(sitemap_url)
+
+    def sources(self):
+        """
+        需要轮询的sitemap源（TS源 管理的列表）
+        默认源未单独配置有效URL时使用config.yaml中的sitemap_url
+        """
+        default_url = self.config.get("sitemap_url")
+        sources = []
+        seen = set()
+        has_default = False
+        for sitemap in self.data.get('sitemaps', []):
+            url = sitemap.get('url')
+            if sitemap.get('name') == DEFAULT_SOURCE_NAME:
+                has_default = True
+                if not str(url).startswith(('http://', 'https://')):
+                    url = default_url
+            if not sitemap.get('enabled', True) or not str(url).startswith(('http://', 'https://')) or url in seen:
+                continue
+            seen.add(url)
+            sources.append(dict(sitemap, url=url))
+        if not has_default and str(default_url).startswith(('http://', 'https://')) and default_url not in seen:
+            sources.insert(0, {'name': DEFAULT_SOURCE_NAME, 'url': default_url, 'enabled': True})
+        return sources
+
+    def source_interval(self, source):
+        """源的检查间隔，未单独设置时使用全局间隔"""
+        return source.get('interval') or self.data['settings']['monitor_interval']
+
+    def current_interval(self, source):
+        """源当前使用的检查间隔：开启自适应时为按发帖频率和请求错误调整后的值"""
+        status = self.source_status(source['url'])
+        if self.adaptive_config() and status['interval']:
+            return status['interval']
+        return self.source_interval(source)
+
+    def _source_due_at(self, source):
+        """源的下次检查时间：上次检查时间加上带抖动的间隔，间隔修改后立即按新值计算"""
+        status = self.source_status(source['url'])
+        return status['last_check'] + self.current_interval(source) * status['jitter']
+
+    def adaptive_config(self):
+        """自适应间隔配置，未开启时返回None"""
+        adaptive = self.config.get('adaptive_interval') or {}
+        return adaptive if adaptive.get('enabled') else None
+
+    def _adapt_interval(self, source, lastmods=(), has_new=False, error=None):
+        """
+        根据本轮检查结果调整源的检查间隔（仅自适应模式）：
+        有新帖时减半，并不超过估计发帖间隔的一半；没有新帖时加倍；
+        请求失败时加倍，429/503时翻4倍并至少等待Retry-After，出错时上限为error_max
+        """
+        adaptive = self.adaptive_config()
+        if not adaptive:
+            return
+        status = self.source_status(source['url'])
+        low, high = adaptive.get('min', 30), adaptive.get('max', 1800)
+        interval = status['interval'] or self.source_interval(source)
+        if error is not None:
+            response = getattr(error, 'response', None)
+            throttled = getattr(response, 'status_code', None) in (429, 503)
+            interval = min(max(interval, low) * (4 if throttled else 2), adaptive.get('error_max', 3600))
+            if throttled:
+                interval = max(interval, parse_retry_after(response.headers.get('Retry-After')) or 0)
+            status['interval'] = interval
+            return
+        gap = self._record_arrivals(source, lastmods)
+        if has_new:
+            interval = min(interval / 2, gap / 2) if gap else interval / 2
+        else:
+            interval = interval * 2
+        status['interval'] = min(max(interval, low), high)
+
+    def _record_arrivals(self, source, lastmods):
+        """记录源的帖子发布时间，返回最近帖子的平均发布间隔（秒），样本不足时返回None"""
+        status = self.source_status(source['url'])
+        if status['arrivals'] is None:
+            # 首次调整时用同一站点的历史记录估计，之后只看sitemap中的lastmod
+            host = urlsplit(source['url']).netloc
+            china_tz = pytz.timezone('Asia/Shanghai')
+            status['arrivals'] = []
+            for record in self.records.records():
+                record_time = parse_record_time(record.get('time'))
+                if record_time and urlsplit(record.get('url', '')).netloc == host:
+                    status['arrivals'].append(china_tz.localize(record_time).timestamp())
+        timestamps = set(status['arrivals'])
+        for lastmod in lastmods:
+            dt = parse_lastmod(lastmod) if lastmod else None
+            if dt:
+                timestamps.add(dt.timestamp())
+        arrivals = sorted(timestamps)[-self.ARRIVAL_SAMPLES:]
+        status['arrivals'] = arrivals
+        if len(arrivals) < 3:
+            return None
+        return (arrivals[-1] - arrivals[0]) / (len(arrivals) - 1)
+
+    def _due_sources(self):
+        """已到下次检查时间的源"""
+        now = time.time()
+        return [source for source in self.sources() if self._source_due_at(source) <= now]
+
+    def _next_poll_delay(self):
+        """距离下一个源到期的秒数"""
+        now = time.time()
+        delays = [self._source_due_at(source) - now for source in self.sources()]
+        if not delays:
+            return self.data['settings']['monitor_interval']
+        return min(max(min(delays), 1), self.data['settings']['monitor_interval'])
+
+    def _count(self, stats, key):
+        """在统计锁内给计数加一"""
+        with self._stats_lock:
+            stats[key] += 1
+
+    def route_stats_for(self, route):
+        """一个路由（分组）启动以来推送统计的副本"""
+        with self._stats_lock:
+            return dict(self.route_stats[route])
+
+    def source_status(self, sitemap_url):
+        """源的运行状态（内存中）：连续失败次数、累计失败次数、最近成功时间等"""
+        with self._sources_lock:
+            if sitemap_url not in self._source_stats:
+                self._source_stats[sitemap_url] = {
+                    'last_check': 0,
+                    'jitter': 1,  # 本轮间隔的随机倍数，避免多个源同时请求
+                    'interval': None,  # 自适应模式下当前使用的检查间隔
+                    'arrivals': None,  # 最近帖子的发布时间戳（升序），用于估计发帖频率
+                    'last_success': None,
+                    'failures': 0,
+                    'total_failures': 0,
+                    'last_error': None,
+                }
+            return self._source_stats[sitemap_url]
+
+    def _is_ignored(self, lastmod):
+        """开启忽略旧帖时，判断帖子是否早于忽略时间"""
+        if not self.ignore_old:
+            return False
+        try:
+            post_time = datetime.fromisoformat(lastmod.replace('Z', '+00:00'))
+            ignore_time = self.data.get('ignore_time')
+            return bool(ignore_time) and post_time < datetime.fromisoformat(ignore_time)
+        except Exception as e:
+            print(f"时间比较错误: {e}")
+            return False
+
+    def _sitemap_state(self, sitemap_url):
+        """获取sitemap源上次成功处理时的校验信息"""
+        return self.data.get('sitemap_state', {}).get(sitemap_url, {})
+
+    def _fetch_sitemap(self, source, state):
+        """
+        拉取一个源的sitemap，支持sitemap索引（sitemapindex）
+        内容未变化时返回None，否则返回([(loc, lastmod)], 本次的校验信息, sitemap中的标题)；
+        索引只重新拉取lastmod有变化（或没有lastmod）的子sitemap，各子sitemap的校验信息记录在children中；
+        有子sitemap拉取失败或被跳过时不返回索引自身的ETag和哈希，下一轮仍会重新读取索引
+        """
+        timeout = source.get('timeout') or self.http.timeout
+        result = self._fetch_document(source['url'], state, timeout)
+        if result is None:
+            return None
+        entries, validators, is_index, titles = result
+        if not is_index:
+            return entries, validators, titles
+
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        previous_children = state.get('children', {})
+        children = {}
+        urls = []
+        fetched = 0
+        incomplete = False
+        for child_url, child_lastmod in entries:
+            previous = previous_children.get(child_url, {})
+            if previous and child_lastmod and previous.get('lastmod') == child_lastmod:
+                children[child_url] = previous
+                continue
+            fetched += 1
+            try:
+                child_result = self._fetch_document(child_url, previous, timeout)
+            except (requests.RequestException, ET.ParseError) as e:
+                # 保留旧的校验信息，下一轮lastmod对不上会再次拉取
+                print(f"[{current_time}] 获取子sitemap {child_url} 失败: {e}")
+                if previous:
+                    children[child_url] = previous
+                incomplete = True
+                continue
+            if child_result is None:
+                children[child_url] = dict(previous, lastmod=child_lastmod)
+                continue
+            child_entries, child_validators, child_is_index, child_titles = child_result
+            if child_is_index:
+                print(f"[{current_time}] 不支持嵌套的sitemap索引: {child_url}")
+                incomplete = True
+                continue
+            child_validators['lastmod'] = child_lastmod
+            children[child_url] = child_validators
+            urls.extend(child_entries)
+            titles.update(child_titles)
+        validators['children'] = children
+        if incomplete:
+            # 索引本身未变化时下一轮会在304或哈希相同处直接返回，失败的子sitemap就再也不会被拉取
+            validators.update(etag=None, last_modified=None, hash=None)
+        print(f"[{current_time}] sitemap索引 {source['name']} 共 {len(entries)} 个子sitemap，重新拉取 {fetched} 个")
+        return urls, validators, titles
+
+    def _fetch_document(self, url, state, timeout):
+        """
+        流式拉取并解析单个sitemap文件
+        内容未变化（304或哈希相同）时返回None，否则返回(条目列表, 本次的校验信息, 是否为索引, 标题)
+        """
+        # lastmod倒序时，遇到早于上次最新时间的条目即可停止读取；多读grace秒，以免漏掉迟到的帖子
+        grace = (self.config.get('dedup') or {}).get('grace', 86400)
+        parser = SitemapStreamParser(stop_before=state.get('newest_lastmod'), grace=grace)
+        digest = hashlib.sha1()
+        entries = []
+
+        def on_chunk(chunk):
+            digest.update(chunk)
+            entries.extend(parser.feed(chunk))
+            return parser.stopped
+
+        response = self.fetcher.stream(url, on_chunk, headers=self._conditional_headers(state), timeout=timeout)
+        if response.status_code == 304:
+            return None
+        if not parser.stopped:
+            entries.extend(parser.close())
+
+        # 服务器不支持ETag/Last-Modified时，以内容哈希判断是否变化；提前停止时没有完整内容，不记录哈希
+        validators = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'hash': None if parser.stopped else digest.hexdigest(),
+            'newest_lastmod': parser.newest_lastmod or state.get('newest_lastmod'),
+        }
+        if validators['hash'] and validators['hash'] == state.get('hash'):
+            return None
+        return entries, validators, parser.is_index, parser.titles
+
+    def _conditional_headers(self, state):
+        """根据上次的ETag/Last-Modified生成条件请求头"""
+        headers = {}
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+        return headers
+
+    def _save_sitemap_state(self, sitemap_url, validators):
+        """sitemap中的新帖全部处理完后记录校验信息"""
+        if self._sitemap_state(sitemap_url) != validators:
+            self.data.setdefault('sitemap_state', {})[sitemap_url] = validators
+            self.save_data(('sitemap_state', sitemap_url))
+
+    def _is_recently_processed(self, url, time_window=60):
+        """检查URL是否在最近一段时间内被处理过"""
+        return self.records.recently_processed(url, time_window)
+
+    def template(self, name=None):
+        """
+        取编译后的模板，name为空时取当前模板；模板内容变化后重新编译，
+        未设置、已删除或内容无效时使用默认消息格式
+        """
+        name = name or self.data.get('current_template')
+        text = self.data['templates'].get(name) if name else None
+        if not isinstance(text, str):
+            name, text = None, DEFAULT_TEMPLATE
+        template = self._templates.get(name)
+        if template is None or template.text != text:
+            try:
+                template = MessageTemplate(text)
+            except ValueError as e:
+                print(f"模板 {name} 无效，改用默认格式: {e}")
+                template = MessageTemplate(DEFAULT_TEMPLATE)
+            self._templates[name] = template
+        return template
+
+    def routing(self):
+        """当前的路由索引，分组或推送列表变化后重建"""
+        routing = self._routing
+        if routing is None:
+            default_receivers = (
+                self.config.get("notify_groups", []) + self.config.get("notify_users", [])
+                + self.data.get('push_list', [])
+                + self.data['groups']['default']['notify_groups'] + self.data['groups']['default']['notify_users']
+            )
+            routing = self._routing = RoutingIndex(default_receivers, self.data['groups']['custom'])
+        return routing
+
+    def _source_name(self, url, source=None):
+        """帖子所属数据源的名称，未指定源时按站点匹配"""
+        if source:
+            return source['name']
+        host = urlsplit(url).netloc
+        for candidate in self.sources():
+            if urlsplit(candidate['url']).netloc == host:
+                return candidate['name']
+        return None
+
+    def render_message(self, post, template_name=None):
+        """用模板渲染帖子消息，同一帖子和模板只渲染一次"""
+        template = self.template(template_name)
+        key = (template.text,) + tuple(post[field] for field in MessageTemplate.FIELDS)
+        with self._render_lock:
+            message = self._render_cache.get(key)
+            if message is not None:
+                self._render_cache.move_to_end(key)
+                return message
+        message = template.render(post)
+        with self._render_lock:
+            self._render_cache[key] = message
+            while len(self._render_cache) > self.RENDER_CACHE_SIZE:
+                self._render_cache.popitem(last=False)
+        return message
+
+    def send_notifications(self, post, source=None):
+        """
+        按路由索引确定接收者，按各自的模板渲染通知（每个模板只渲染一次），写入发件箱后交给分发器发送，
+        失败的接收者由投递线程按退避时间单独重发
+        """
+        try:
+            routing = self.routing()
+            routes = routing.route(self._source_name(post['url'], source), post['title'], post['author'])
+            for name in set(routes.values()):
+                with self._stats_lock:
+                    self.route_stats[name]['posts'] += 1
+
+            by_template = defaultdict(list)
+            for receiver_id in sorted(routes):
+                by_template[routing.templates.get(receiver_id)].append(receiver_id)
+
+            for template_name, receivers in by_template.items():
+                message = self.render_message(post, template_name)
+                items = [
+                    {
+                        'id': uuid.uuid4().hex,
+                        'url': post['url'],
+                        'receiver': receiver_id,
+                        'route': routes[receiver_id],
+                        'message': message,
+                        'attempts': 0,
+                        'next_attempt_at': time.time(),
+                    }
+                    for receiver_id in receivers
+                ]
+                # 先登记为发送中，避免投递线程在写入后把它们当作到期消息重复发送
+                with self._outbox_lock:
+                    self._outbox_inflight.update(item['id'] for item in items)
+                for item in items:
+                    self.store.put_outbox(item)
+                self._dispatch_outbox(message, items)
+            
+        except Exception as e:
+            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"[{current_time}] 发送通知失败: {e}")
 
-    def check_sitemap(self, is_test=False):
-        """检查sitemap获取新帖子"""
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"\n[{current_time}] {'[测试模式]' if is_test else '[正常模式]'} 开始检查sitemap")
-        
-        # 尝试获取检查锁，如果获取不到说明已经有检查在进行
-        if not self._check_lock.acquire(blocking=False):
-            print(f"[{current_time}] 已有检查正在进行，跳过本次检查")
-            return
+    def _dispatch_outbox(self, message, items):
+        """把同一条消息的发件箱条目交给分发器"""
+        by_receiver = {item['receiver']: item for item in items}
+        with self._outbox_lock:
+            self._outbox_inflight.update(item['id'] for item in items)
 
+        def report(results):
+            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"[{current_time}] 成功发送到 {sum(results.values())}/{len(results)} 个接收者")
+            for receiver_id, ok in results.items():
+                self._outbox_result(by_receiver[receiver_id], ok)
+
+        self.dispatcher.dispatch(message, list(by_receiver), on_done=report)
+
+    def _outbox_result(self, item, ok):
+        """发送成功移出发件箱；失败时按指数退避安排重发，超过最大次数后放弃"""
         try:
-            # 重新加载数据，确保使用最新状态
-            self._load_data()
-            
-            print(f"[{current_time}] 当前状态:")
-            print(f"- 处理中URLs数量: {len(self._processing_urls)}")
-            print(f"- 已处理URLs数量: {len(self._processed_urls)}")
-            print(f"- 历史记录数量: {len(self._history)}")
-            print(f"- 重试队列数量: {len(self._retry_queue)}")
-            
-            try:
-                # 添加超时设置
-                response = requests.get(self.config.get("sitemap_url"), timeout=10)
-                response.raise_for_status()  # 检查响应状态
-            except requests.RequestException as e:
-                print(f"[{current_time}] 获取sitemap失败: {e}")
-                return
-            
-            try:
-                root = ET.fromstring(response.content)
-            except ET.ParseError as e:
-                print(f"[{current_time}] 解析sitemap失败: {e}")
-                return
-            
-            # 获取所有URL条目并按时间排序
-            urls = []
-            with self._processing_lock:  # 使用锁检查URL状态
-                for url in root.findall('.//{http://www.sitemaps.org/schemas/sitemap/0.9}url'):
-                    try:
-                        loc = url.find('{http://www.sitemaps.org/schemas/sitemap/0.9}loc').text
-                        lastmod = url.find('{http://www.sitemaps.org/schemas/sitemap/0.9}lastmod').text
-                        
-                        # 检查是否已经在历史记录中（包括所有状态）
-                        if not is_test and loc in self._processed_urls:
-                            print(f"[{current_time}] 跳过已处理的URL: {loc}")
-                            continue
-                            
-                        # 检查是否在处理中或重试队列中
-                        if not is_test and (loc in self._processing_urls or loc in [item['url'] for item in self._retry_queue]):
-                            print(f"[{current_time}] 跳过处理中的URL: {loc}")
-                            continue
-                            
-                        urls.append((loc, lastmod))
-                    except AttributeError:
-                        continue
-            
-            # 如果没有新的URL，直接返回
-            if not urls:
-                print(f"[{current_time}] 没有新的帖子需要处理")
+            with self._stats_lock:
+                self.route_stats[item.get('route', RoutingIndex.DEFAULT_ROUTE)]['sent' if ok else 'failed'] += 1
+            if ok:
+                self.store.remove_outbox(item['id'])
                 return
-                
-            print(f"[{current_time}] 找到 {len(urls)} 个新帖子")
-            
-            # 按时间倒序排序
-            urls.sort(key=lambda x: x[1], reverse=True)
-            
-            # 如果是测试模式，只处理最新的一条
-            if is_test:
-                loc, lastmod = urls[0]
-                print(f"[{current_time}] 测试模式：处理最新的帖子")
-                self.process_post(loc, lastmod, force=True)
+            # 发件箱重发有自己的设置（config.yaml的delivery），与帖子处理失败的TS重试开关无关
+            delivery = self.config.get('delivery') or {}
+            attempts = item['attempts'] + 1
+            if attempts >= delivery.get('max_attempts', 5):
+                self.store.remove_outbox(item['id'])
+                self._count(self.data['statistics'], 'failed_pushes')
+                self.save_data('statistics')
                 return
-                
-            # 正常模式，处理最新的帖子
-            if urls and self._is_running:
-                loc, lastmod = urls[0]
-                print(f"[{current_time}] 开始处理最新的帖子")
-                
-                # 检查是否需要忽略旧帖子
-                if self._ignore_old:
-                    try:
-                        post_time = datetime.fromisoformat(lastmod.replace('Z', '+00:00'))
-                        ignore_time = self.data.get('ignore_time')
-                        if ignore_time and post_time < datetime.fromisoformat(ignore_time):
-                            print(f"[{current_time}] 跳过旧帖子")
-                            return
-                    except Exception as e:
-                        print(f"[{current_time}] 时间比较错误: {e}")
-                        return
-                
-                # 直接处理帖子，不使用新线程
-                self.process_post(loc, lastmod)
-            
-        except Exception as e:
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            error_msg = f"[{current_time}] 检查sitemap出错: {e}"
-            print(error_msg)
-            if is_test:
-                self.wcf.send_text(error_msg, self.msg.sender, None)
+            delay = min(delivery.get('base_delay', 30) * 2 ** (attempts - 1), delivery.get('max_delay', 3600))
+            self.store.put_outbox(dict(item, attempts=attempts, next_attempt_at=time.time() + delay))
+            self.jobs.schedule('outbox', delay, earlier_only=True)
         finally:
-            self._check_lock.release()  # 释放检查锁
+            # 发件箱更新之后再解除登记，投递线程不会看到已发送但未移除的消息
+            with self._outbox_lock:
+                self._outbox_inflight.discard(item['id'])
 
-    def _is_recently_processed(self, url, time_window=60):
-        """检查URL是否在最近一段时间内被处理过"""
-        current_time = datetime.now()
-        for history in reversed(self._history):
-            if history['url'] == url:
-                history_time = datetime.fromisoformat(history['time'])
-                if (current_time - history_time).total_seconds() < time_window:
-                    return True
-        return False
+    def retry_count(self):
+        """等待重试的帖子数"""
+        return len(self._retry_scheduler)
 
-    def _format_message(self, title, author, time, url):
-        """格式化消息"""
-        return (
-            "📢 论坛新贴通知 📢\n"
-            "━━━━━━━━━━━━━━\n"
-            f"📌 标题：{title}\n"
-            f"👤 作者：{author}\n"
-            f"🕒 时间：{time}\n"
-            f"🔗 链接：{url}\n"
-            "━━━━━━━━━━━━━━\n"
-            "💬 复制链接浏览器打开去评论吧！"
-        )
-    
-    def export_history(self):
-        """导出历史记录"""
-        try:
-            # 创建历史记录文本
-            history_text = "📑 论坛监控历史记录\n" + "=" * 50 + "\n\n"
-            for record in self._history:
-                history_text += (
-                    f"🕒 时间：{record['time']}\n"
-                    f"📌 标题：{record['title']}\n"
-                    f"👤 作者：{record['author']}\n"
-                    f"🔗 链接：{record['url']}\n"
-                    f"📝 状态：{'再次推送' if record.get('status') == 'reposted' else '首次推送'}\n"
-                    + "-" * 30 + "\n"
-                )
-            
-            # 直接发送文本消息而不是文件
-            self.wcf.send_text(history_text, self.msg.sender, None)
-            return True
-        except Exception as e:
-            print(f"导出历史记录失败: {e}")
-            return False
+    def outbox_count(self):
+        """发件箱中尚未送达的消息数"""
+        return len(self.store.outbox_items())
+
+    def _outbox_job(self):
+        """重发到期的发件箱消息，返回距离最早的下次重发时间的秒数"""
+        now = time.time()
+        next_due = None
+        with self._outbox_lock:
+            inflight = set(self._outbox_inflight)
+        for item in self.store.outbox_items():
+            if item['id'] in inflight:
+                continue
+            if item['next_attempt_at'] <= now:
+                self._dispatch_outbox(item['message'], [item])
+            elif next_due is None or item['next_attempt_at'] < next_due:
+                next_due = item['next_attempt_at']
+        return None if next_due is None else next_due - time.time()
             
-    def send_notifications(self, message):
-        """发送通知到配置的群和用户"""
+    def start_backup_job(self):
+        """立即备份一次，之后按备份间隔继续"""
+        self.jobs.schedule('backup')
+
+    def start_retry_job(self):
+        """立即处理到期的重试"""
+        self.jobs.schedule('retry')
+
+    def start_cleanup_job(self):
+        """立即清理一次历史记录，之后每天一次"""
+        self.jobs.schedule('cleanup')
+
+    def _backup_job(self):
+        if not self.data['settings']['backup']['enabled']:
+            return None
+        self.create_backup()
+        return self.data['settings']['backup']['interval']
+
+    def _retry_delay(self):
+        """距离最早的重试到期的秒数，没有待重试的帖子时返回None"""
+        next_due = self._retry_scheduler.next_due()
+        return None if next_due is None else next_due - time.time()
+
+    def _retry_job(self):
+        """处理所有到期的帖子，返回距离下一个帖子到期的秒数"""
+        if not self.data['settings']['retry']['enabled']:
+            return None
+        self._process_retry_queue()
+        return self._retry_delay()
+
+    def _cleanup_job(self):
+        if not self.data['settings']['history_cleanup']['enabled']:
+            return None
+        self.cleanup_history()
+        return 86400  # 每天检查一次
+
+    def create_backup(self):
+        """创建备份"""
         try:
-            # 获取配置的群和用户
-            notify_groups = self.config.get("notify_groups", [])
-            notify_users = self.config.get("notify_users", [])
-            
-            # 确保列表中的所有ID都是字符串类型并去重
-            unique_receivers = set(str(id) for id in notify_groups + notify_users)
-            
-            # 记录发送状态
-            sent_count = 0
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            for receiver_id in unique_receivers:
-                try:
-                    self.wcf.send_text(message, receiver_id, None)
-                    sent_count += 1
-                except Exception as e:
-                    print(f"[{current_time}] 发送到 {receiver_id} 失败: {e}")
-            
-            print(f"[{current_time}] 成功发送到 {sent_count}/{len(unique_receivers)} 个接收者")
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            backup_file = os.path.join(self._backup_dir, f'backup_{timestamp}.json')
+            # 先把变更日志合并进快照，备份文件才是完整数据
+            self.store.compact()
+            shutil.copy2(self._data_file, backup_file)
             
+            # 清理旧备份
+            backups = sorted([f for f in os.listdir(self._backup_dir) if f.startswith('backup_')])
+            max_backups = self.data['settings']['backup']['max_backups']
+            if len(backups) > max_backups:
+                for old_backup in backups[:-max_backups]:
+                    os.remove(os.path.join(self._backup_dir, old_backup))
         except Exception as e:
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"[{current_time}] 发送通知失败: {e}")
+            print(f"创建备份失败: {e}")
+
+    def _process_retry_queue(self):
+        """处理所有到期的重试，再次失败的按指数退避重新安排"""
+        for retry_item in self._retry_scheduler.pop_due():
+            if self.process_post(retry_item['url'], retry_item.get('lastmod')):
+                continue
+            # 期间已被其他途径处理完成的不再重试
+            if not self.is_processed(retry_item['url']):
+                self._schedule_retry(retry_item['url'], retry_item.get('lastmod'), retry_item['attempts'] + 1)
+
+    def cleanup_history(self):
+        """清理历史记录"""
+        if not self.data['settings']['history_cleanup']['enabled']:
+            return
             
+        max_days = self.data['settings']['history_cleanup']['max_days']
+        cutoff_date = datetime.now() - timedelta(days=max_days)
+        removed = self.records.cleanup_before(cutoff_date)
+        print(f"已清理 {removed} 条过期历史记录")
+
+
+class Forum_monitor(Plugin):
+    """
+    论坛新帖监控插件
+    监控WordPress网站的sitemap,发现新帖时推送通知
+    基础命令：
+    - TS帮助: 显示命令菜单
+    - TS测试: 测试监控和推送功能
+    - TS开启: 开启推送
+    - TS关闭: 关闭推送
+    - TS清理: 清除已处理的URL缓存
+    - TS状态: 查看当前状态
+    - TS间隔 <秒数>: 设置检查间隔时间
+    - TS推送 <URL>: 再次推送指定URL的帖子
+    - TS重载: 从磁盘强制重新加载数据
+    
+    高级功能：
+    - TS忽略旧帖: 忽略当前时间之前的帖子
+    - TS历史记录: 导出历史推送记录
+    
+    备份功能：
+    - TS备份: 手动备份数据
+    - TS备份设置 开启/关闭: 开启或关闭自动备份
+    - TS备份间隔 <小时>: 设置备份间隔
+    - TS备份数量 <数量>: 设置保留的备份数量
+    
+    重试机制：
+    - TS重试 开启/关闭: 开启或关闭失败重试
+    - TS重试次数 <次数>: 设置最大重试次数
+    - TS重试间隔 <秒数>: 设置重试间隔
+    
+    频率限制：
+    - TS频率 开启/关闭: 开启或关闭推送频率限制
+    - TS频率设置 <次数/分钟>: 设置每分钟最大推送次数
+    
+    时间段设置：
+    - TS时段 开启/关闭: 开启或关闭时间段限制
+    - TS时段设置 <开始时间> <结束时间>: 设置推送时间段(格式:HH:MM)
+    
+    内容过滤：
+    - TS过滤 开启/关闭: 开启或关闭内容过滤
+    - TS过滤词 添加/删除 <关键词>: 管理过滤关键词（设置后只推送命中其一的帖子）
+    - TS黑名单 添加/删除 <关键词>: 命中则不推送
+    - TS白名单 添加/删除 <关键词>: 命中则一定推送，优先于黑名单
+    - TS过滤词列表: 查看所有过滤词及命中次数
+    
+    数据源管理：
+    - TS源 添加 <名称> <URL>: 添加新的sitemap源
+    - TS源 删除 <名称>: 删除指定sitemap源
+    - TS源 列表: 查看所有sitemap源
+    - TS源 开启/关闭 <名称>: 启用或禁用指定源
+    - TS源 间隔/超时 <名称> <秒数>: 设置指定源的检查间隔或请求超时
+    - TS源 选择器 <名称> <标题/作者> <CSS选择器>: 设置指定源帖子页面的提取选择器
+    - TS源 元数据 <名称> <来源,...|页面>: 设置指定源批量获取帖子详情的来源（sitemap/rss/wp-json）
+    
+    推送模板：
+    - TS模板 添加 <名称> <模板内容>: 添加新的推送模板，占位符：{title} {author} {time} {url}
+    - TS模板 删除 <名称>: 删除指定模板
+    - TS模板 列表: 查看所有模板
+    - TS模板 设置 <名称>: 设置当前使用的模板
+    
+    分组管理：
+    - TS分组 创建 <名称>: 创建新的推送分组
+    - TS分组 删除 <名称>: 删除指定分组
+    - TS分组 添加 <分组> <群ID/用户ID>: 添加推送对象到分组
+    - TS分组 移除 <分组> <群ID/用户ID>: 从分组移除推送对象
+    - TS分组 模板 <分组> <模板名|默认>: 设置分组成员收到的消息使用的模板
+    - TS分组 来源 <分组> <源名称,...|全部>: 分组只接收这些数据源的帖子
+    - TS分组 关键词 <分组> <关键词,...|全部>: 分组只接收标题或作者包含这些关键词的帖子
+    - TS分组 列表: 查看所有分组
+    
+    历史记录管理：
+    - TS历史清理 开启/关闭: 开启或关闭自动清理
+    - TS历史天数 <天数>: 设置保留天数
+    - TS历史立即清理: 立即清理过期记录
+    """
+    
+    name = 'Forum_monitor'
+    _data_file = os.path.join(os.path.dirname(__file__), 'data.json')
+    _backup_dir = os.path.join(os.path.dirname(__file__), 'backups')
+    
+    def __init__(self, wcf, msg):
+        super().__init__(wcf, msg)
+        # 数据和后台线程由进程内唯一的引擎持有，这里只做命令分发
+        self.engine = MonitorEngine.get_instance(wcf, self.config, self._data_file, self._backup_dir)
+
     def show_help(self):
         """显示帮助菜单"""
         help_text = (
@@ -619,6 +3548,7 @@ class Forum_monitor(Plugin):
             "• TS关闭 - 关闭推送\n"
             "• TS清理 - 清除URL缓存\n"
             "• TS间隔 <秒数> - 设置检查间隔\n"
+            "• TS重载 - 重新加载数据文件\n"
             "\n"
             "📊 高级功能：\n"
             "• TS忽略旧帖 - 忽略历史帖子\n"
@@ -645,13 +3575,18 @@ class Forum_monitor(Plugin):
             "🔍 内容过滤：\n"
             "• TS过滤 开启/关闭 - 内容过滤开关\n"
             "• TS过滤词 添加/删除 <关键词> - 管理关键词\n"
-            "• TS过滤词列表 - 查看过滤关键词\n"
+            "• TS黑名单 添加/删除 <关键词> - 命中则不推送\n"
+            "• TS白名单 添加/删除 <关键词> - 命中则必推送\n"
+            "• TS过滤词列表 - 查看过滤词及命中次数\n"
             "\n"
             "📡 数据源管理：\n"
             "• TS源 添加 <名称> <URL> - 添加数据源\n"
             "• TS源 删除 <名称> - 删除数据源\n"
             "• TS源 列表 - 查看所有数据源\n"
             "• TS源 开启/关闭 <名称> - 控制数据源\n"
+            "• TS源 间隔/超时 <名称> <秒数> - 设置源的间隔或超时\n"
+            "• TS源 选择器 <名称> <标题/作者> <CSS选择器> - 设置源的提取选择器\n"
+            "• TS源 元数据 <名称> <来源,...|页面> - 设置源的详情来源\n"
             "\n"
             "📝 推送模板：\n"
             "• TS模板 添加 <名称> <内容> - 添加模板\n"
@@ -664,6 +3599,8 @@ class Forum_monitor(Plugin):
             "• TS分组 删除 <名称> - 删除推送分组\n"
             "• TS分组 添加 <分组> <ID> - 添加推送对象\n"
             "• TS分组 移除 <分组> <ID> - 移除推送对象\n"
+            "• TS分组 模板 <分组> <模板名|默认> - 设置分组模板\n"
+            "• TS分组 来源/关键词 <分组> <名称,...|全部> - 设置分组接收条件\n"
             "• TS分组 列表 - 查看所有分组\n"
             "\n"
             "🗑️ 历史管理：\n"
@@ -697,7 +3634,7 @@ class Forum_monitor(Plugin):
                 self.show_help()
             elif full_cmd == "TS推送列表":
                 # 查看推送列表
-                push_list = self.data.get('push_list', [])
+                push_list = self.engine.data.get('push_list', [])
                 if not push_list:
                     self.send_response("推送列表为空")
                 else:
@@ -725,32 +3662,41 @@ class Forum_monitor(Plugin):
                 # 在群里回复一个简单的确认
                 self.send_response("✅ 已发送群ID到管理员")
             elif full_cmd == "TS测试":
-                self.check_sitemap(is_test=True)
+                self.engine.check_sitemap(is_test=True, reply_to=self.msg.sender)
             elif full_cmd == "TS清理":
-                old_count = len(self._processed_urls)
-                self._processed_urls.clear()
-                self._history.clear()  # 同时清理历史记录
-                self._save_data()
+                old_count = self.engine.processed_count()
+                if self.engine.bloom is not None:
+                    self.engine.bloom.clear()
+                self.engine.records.clear()  # 同时清理历史记录
+                if self.engine.store.dedup is not None and self.engine.records is not self.engine.store:
+                    self.engine.store.clear_seen()
                 self.send_response(f"已清除URL缓存和历史记录，共清除{old_count}条记录")
             elif full_cmd == "TS开启":
-                self._is_running = True
-                self._start_monitor_thread()
-                self._save_data()
+                self.engine.is_running = True
+                self.engine.start_monitor()
+                self.engine.save_data()
                 self.send_response("✅ 已开启论坛监控推送")
             elif full_cmd == "TS关闭":
-                self._is_running = False
-                self._stop_monitor_thread()
-                self._save_data()
+                self.engine.is_running = False
+                self.engine.stop_monitor()
+                self.engine.save_data()
                 self.send_response("⛔ 已关闭论坛监控推送")
+            elif full_cmd == "TS重载":
+                self.engine.load_data()
+                self.send_response(
+                    f"✅ 已重新加载数据\n"
+                    f"已处理URL：{self.engine.processed_count()} 条\n"
+                    f"历史记录数：{self.engine.records.history_count()} 条"
+                )
             elif full_cmd == "TS忽略旧帖":
-                self._ignore_old = True
-                self.data['ignore_time'] = datetime.now(pytz.UTC).isoformat()
-                self._save_data()
+                self.engine.ignore_old = True
+                self.engine.data['ignore_time'] = datetime.now(pytz.UTC).isoformat()
+                self.engine.save_data()
                 self.send_response("✅ 已设置忽略当前时间之前的帖子")
             elif full_cmd.startswith("TS推送 "):
                 url = full_cmd[5:].strip()
                 if url:
-                    if self.process_post(url, force=True):
+                    if self.engine.process_post(url, force=True):
                         self.send_response("✅ 推送完成")
                     else:
                         self.send_response("❌ 推送失败")
@@ -763,120 +3709,149 @@ class Forum_monitor(Plugin):
                         self.send_response("❌ 间隔时间不能小于10秒")
                         return
                     # 更新所有相关的间隔时间设置
-                    self.config["monitor_interval"] = interval
-                    self.data['settings']['monitor_interval'] = interval
-                    self._save_data()  # 确保设置被保存
-                    # 重启监控线程以应用新的间隔时间
-                    if self._is_running:
-                        self._stop_monitor_thread()
-                        self._start_monitor_thread()
+                    self.engine.config["monitor_interval"] = interval
+                    self.engine.data['settings']['monitor_interval'] = interval
+                    self.engine.save_data()  # 确保设置被保存
+                    # 立即按新的间隔重新计算下次检查时间
+                    if self.engine.is_running:
+                        self.engine.start_monitor()
                     self.send_response(f"✅ 已设置监控间隔为{interval}秒")
                 except ValueError:
                     self.send_response("❌ 请输入有效的数字")
             elif full_cmd == "TS状态":
+                http_stats = self.engine.fetcher.stats()
+                cache = self.engine.details_cache
+                limit_stats = self.engine.dispatcher.limiter.stats()
+                receiver_lines = "".join(
+                    f"• {receiver}：成功 {stats['sent']} / 失败 {stats['failed']}\n"
+                    for receiver, stats in sorted(self.engine.dispatcher.receiver_stats().items())
+                )
+                source_lines = "".join(
+                    f"• {source['name']}：当前间隔 {self.engine.current_interval(source):.0f}秒\n"
+                    for source in self.engine.sources()
+                )
                 status = (
                     "📊 论坛监控状态\n"
                     "━━━━━━━━━━━━━━\n"
-                    f"推送开关：{'✅ 开启' if self._is_running else '⛔ 关闭'}\n"
-                    f"忽略旧帖：{'✅ 是' if self._ignore_old else '❌ 否'}\n"
-                    f"检查间隔：{self.data['settings']['monitor_interval']}秒\n"
-                    f"已处理URL：{len(self._processed_urls)} 条\n"
-                    f"历史记录数：{len(self._history)} 条\n"
+                    f"推送开关：{'✅ 开启' if self.engine.is_running else '⛔ 关闭'}\n"
+                    f"忽略旧帖：{'✅ 是' if self.engine.ignore_old else '❌ 否'}\n"
+                    f"检查间隔：{self.engine.data['settings']['monitor_interval']}秒"
+                    f"{'（自适应）' if self.engine.adaptive_config() else ''}\n"
+                    f"{source_lines}"
+                    f"已处理URL：{self.engine.processed_count()} 条\n"
+                    f"历史记录数：{self.engine.records.history_count()} 条\n"
+                    f"HTTP连接：新建 {http_stats['opened']} / 复用 {http_stats['reused']}\n"
+                    f"Sitemap未变化：命中 {self.engine.sitemap_stats['hits']} / 未命中 {self.engine.sitemap_stats['misses']}\n"
+                    f"帖子详情：元数据 {self.engine.details_stats['metadata']} / 抓取页面 {self.engine.details_stats['pages']}\n"
+                    f"详情缓存：{len(cache)}条，命中 {cache.stats['hits']} / 未命中 {cache.stats['misses']}（过期 {cache.stats['expired']}）"
+                    f" / 304复用 {cache.stats['revalidated']} / 淘汰 {cache.stats['evictions']}\n"
+                    f"推送队列：待发送 {self.engine.dispatcher.pending()} 条，发件箱 {self.engine.outbox_count()} 条，"
+                    f"待重试帖子 {self.engine.retry_count()} 个\n"
+                    f"发送限速：排队 {limit_stats['waiting']} 条，被限速 {limit_stats['throttled']}/{limit_stats['acquired']} 次，"
+                    f"平均等待 {limit_stats['avg_wait']:.1f}秒，最长 {limit_stats['max_wait']:.1f}秒\n"
+                    f"{receiver_lines}"
                     "━━━━━━━━━━━━━━"
                 )
                 self.send_response(status)
             
             # 备份功能命令
             elif full_cmd == "TS备份":
-                self._create_backup()
+                self.engine.create_backup()
                 self.send_response("✅ 已完成手动备份")
             elif full_cmd == "TS备份设置 开启":
-                self.data['settings']['backup']['enabled'] = True
-                self._save_data()
-                self._start_backup_thread()
+                self.engine.data['settings']['backup']['enabled'] = True
+                self.engine.save_data()
+                self.engine.start_backup_job()
                 self.send_response("✅ 已开启自动备份")
             elif full_cmd == "TS备份设置 关闭":
-                self.data['settings']['backup']['enabled'] = False
-                self._save_data()
+                self.engine.data['settings']['backup']['enabled'] = False
+                self.engine.save_data()
+                self.engine.jobs.cancel('backup')
                 self.send_response("⛔ 已关闭自动备份")
             elif full_cmd.startswith("TS备份间隔 "):
                 try:
                     hours = int(full_cmd.split(" ")[1])
-                    self.data['settings']['backup']['interval'] = hours * 3600
-                    self._save_data()
+                    self.engine.data['settings']['backup']['interval'] = hours * 3600
+                    self.engine.save_data()
+                    if self.engine.data['settings']['backup']['enabled']:
+                        self.engine.jobs.schedule('backup', hours * 3600)
                     self.send_response(f"✅ 已设置备份间隔为{hours}小时")
                 except:
                     self.send_response("❌ 请指定有效的小时数")
             elif full_cmd.startswith("TS备份数量 "):
                 try:
                     count = int(full_cmd.split(" ")[1])
-                    self.data['settings']['backup']['max_backups'] = count
-                    self._save_data()
+                    self.engine.data['settings']['backup']['max_backups'] = count
+                    self.engine.save_data()
                     self.send_response(f"✅ 已设置保留{count}个备份")
                 except:
                     self.send_response("❌ 请指定有效的备份数量")
             
             # 重试机制命令
             elif full_cmd == "TS重试 开启":
-                self.data['settings']['retry']['enabled'] = True
-                self._save_data()
-                self._start_retry_thread()
+                self.engine.data['settings']['retry']['enabled'] = True
+                self.engine.save_data()
+                self.engine.start_retry_job()
                 self.send_response("✅ 已开启失败重试")
             elif full_cmd == "TS重试 关闭":
-                self.data['settings']['retry']['enabled'] = False
-                self._save_data()
+                self.engine.data['settings']['retry']['enabled'] = False
+                self.engine.save_data()
+                self.engine.jobs.cancel('retry')
                 self.send_response("⛔ 已关闭失败重试")
             elif full_cmd.startswith("TS重试次数 "):
                 try:
                     attempts = int(full_cmd.split(" ")[1])
-                    self.data['settings']['retry']['max_attempts'] = attempts
-                    self._save_data()
+                    self.engine.data['settings']['retry']['max_attempts'] = attempts
+                    self.engine.save_data()
                     self.send_response(f"✅ 已设置最大重试次数为{attempts}次")
                 except:
                     self.send_response("❌ 请指定有效的重试次数")
             elif full_cmd.startswith("TS重试间隔 "):
                 try:
                     delay = int(full_cmd.split(" ")[1])
-                    self.data['settings']['retry']['delay'] = delay
-                    self._save_data()
+                    self.engine.data['settings']['retry']['delay'] = delay
+                    self.engine.save_data()
                     self.send_response(f"✅ 已设置重试间隔为{delay}秒")
                 except:
                     self.send_response("❌ 请指定有效的间隔秒数")
             
             # 推送控制命令
             elif full_cmd == "TS频率 开启":
-                self.data['settings']['rate_limit']['enabled'] = True
-                self._save_data()
+                self.engine.data['settings']['rate_limit']['enabled'] = True
+                self.engine.save_data()
+                self.engine.update_rate_limit()
                 self.send_response("✅ 已开启推送频率限制")
             elif full_cmd == "TS频率 关闭":
-                self.data['settings']['rate_limit']['enabled'] = False
-                self._save_data()
+                self.engine.data['settings']['rate_limit']['enabled'] = False
+                self.engine.save_data()
+                self.engine.update_rate_limit()
                 self.send_response("⛔ 已关闭推送频率限制")
             elif full_cmd.startswith("TS频率设置 "):
                 try:
                     rate = int(full_cmd.split(" ")[1])
-                    self.data['settings']['rate_limit']['max_per_minute'] = rate
-                    self._save_data()
+                    self.engine.data['settings']['rate_limit']['max_per_minute'] = rate
+                    self.engine.save_data()
+                    self.engine.update_rate_limit()
                     self.send_response(f"✅ 已设置最大推送频率为每分钟{rate}次")
                 except:
                     self.send_response("❌ 请指定有效的推送频率")
             
             # 时间段设置命令
             elif full_cmd == "TS时段 开启":
-                self.data['settings']['schedule']['enabled'] = True
-                self._save_data()
+                self.engine.data['settings']['schedule']['enabled'] = True
+                self.engine.save_data()
                 self.send_response("✅ 已开启时间段限制")
             elif full_cmd == "TS时段 关闭":
-                self.data['settings']['schedule']['enabled'] = False
-                self._save_data()
+                self.engine.data['settings']['schedule']['enabled'] = False
+                self.engine.save_data()
                 self.send_response("⛔ 已关闭时间段限制")
             elif full_cmd.startswith("TS时段设置 "):
                 try:
                     times = full_cmd.split(" ")[1:]
                     if len(times) == 2:
-                        self.data['settings']['schedule']['start_time'] = times[0]
-                        self.data['settings']['schedule']['end_time'] = times[1]
-                        self._save_data()
+                        self.engine.data['settings']['schedule']['start_time'] = times[0]
+                        self.engine.data['settings']['schedule']['end_time'] = times[1]
+                        self.engine.save_data()
                         self.send_response(f"✅ 已设置推送时段为{times[0]}至{times[1]}")
                     else:
                         self.send_response("❌ 请指定开始和结束时间，格式：TS时段设置 09:00 23:00")
@@ -885,51 +3860,52 @@ class Forum_monitor(Plugin):
             
             # 内容过滤命令
             elif full_cmd == "TS过滤 开启":
-                self.data['settings']['content_filter']['enabled'] = True
-                self._save_data()
+                self.engine.data['settings']['content_filter']['enabled'] = True
+                self.engine.save_data()
                 self.send_response("✅ 已开启内容过滤")
             elif full_cmd == "TS过滤 关闭":
-                self.data['settings']['content_filter']['enabled'] = False
-                self._save_data()
+                self.engine.data['settings']['content_filter']['enabled'] = False
+                self.engine.save_data()
                 self.send_response("⛔ 已关闭内容过滤")
-            elif full_cmd.startswith("TS过滤词 添加 "):
-                keyword = full_cmd[8:].strip()
-                if keyword:
-                    if keyword not in self.data['settings']['content_filter']['keywords']:
-                        self.data['settings']['content_filter']['keywords'].append(keyword)
-                        self._save_data()
-                        self.send_response(f"✅ 已添加过滤关键词：{keyword}")
+            elif re.match(r"TS(过滤词|黑名单|白名单) (添加|删除) ", full_cmd):
+                _, action, keyword = full_cmd.split(" ", 2)
+                kind, label = {
+                    "TS过滤词": ('keywords', "过滤关键词"),
+                    "TS黑名单": ('blacklist', "黑名单词"),
+                    "TS白名单": ('whitelist', "白名单词"),
+                }[full_cmd.split(" ", 1)[0]]
+                keyword = keyword.strip()
+                words = self.engine.data['settings']['content_filter'].setdefault(kind, [])
+                if not keyword:
+                    self.send_response(f"❌ 请指定要{action}的关键词")
+                elif action == "添加":
+                    if keyword not in words:
+                        words.append(keyword)
+                        self.engine.save_data()
+                        self.send_response(f"✅ 已添加{label}：{keyword}")
                     else:
                         self.send_response("❌ 该关键词已存在")
-                else:
-                    self.send_response("❌ 请指定要添加的关键词")
-            elif full_cmd.startswith("TS过滤词 删除 "):
-                keyword = full_cmd[8:].strip()
-                if keyword in self.data['settings']['content_filter']['keywords']:
-                    self.data['settings']['content_filter']['keywords'].remove(keyword)
-                    self._save_data()
-                    self.send_response(f"✅ 已删除过滤关键词：{keyword}")
+                elif keyword in words:
+                    words.remove(keyword)
+                    self.engine.save_data()
+                    self.send_response(f"✅ 已删除{label}：{keyword}")
                 else:
                     self.send_response("❌ 未找到该关键词")
             elif full_cmd == "TS过滤词列表":
-                keywords = self.data['settings']['content_filter']['keywords']
-                if keywords:
-                    keyword_list = "\n".join([f"• {kw}" for kw in keywords])
-                    self.send_response(f"📝 当前过滤关键词：\n{keyword_list}")
-                else:
-                    self.send_response("📝 当前没有设置过滤关键词")
+                self.send_response(self.format_filter())
             
             # 数据源管理命令
             elif full_cmd.startswith("TS源 添加 "):
                 try:
-                    _, name, url = full_cmd.split(" ", 2)
-                    if not any(s['name'] == name for s in self.data['sitemaps']):
-                        self.data['sitemaps'].append({
+                    _, _, name, url = full_cmd.split(" ", 3)
+                    if not any(s['name'] == name for s in self.engine.data['sitemaps']):
+                        self.engine.data['sitemaps'].append({
                             'name': name,
                             'url': url,
                             'enabled': True
                         })
-                        self._save_data()
+                        self.engine.save_data()
+                        self.engine.start_monitor()  # 新源立即参与调度
                         self.send_response(f"✅ 已添加数据源：{name}")
                     else:
                         self.send_response("❌ 该数据源名称已存在")
@@ -937,30 +3913,81 @@ class Forum_monitor(Plugin):
                     self.send_response("❌ 格式错误，请使用：TS源 添加 <名称> <URL>")
             elif full_cmd.startswith("TS源 删除 "):
                 name = full_cmd[6:].strip()
-                for i, sitemap in enumerate(self.data['sitemaps']):
+                for i, sitemap in enumerate(self.engine.data['sitemaps']):
                     if sitemap['name'] == name:
-                        del self.data['sitemaps'][i]
-                        self._save_data()
+                        del self.engine.data['sitemaps'][i]
+                        self.engine.save_data()
                         self.send_response(f"✅ 已删除数据源：{name}")
                         break
                 else:
                     self.send_response("❌ 未找到该数据源")
             elif full_cmd == "TS源 列表":
-                if self.data['sitemaps']:
-                    sitemap_list = "\n".join([
-                        f"• {s['name']}: {s['url']} ({'启用' if s['enabled'] else '禁用'})"
-                        for s in self.data['sitemaps']
-                    ])
-                    self.send_response(f"📡 数据源列表：\n{sitemap_list}")
+                if self.engine.data['sitemaps']:
+                    self.send_response("📡 数据源列表：\n" + self.format_sources())
                 else:
                     self.send_response("📡 当前没有配置数据源")
+            elif full_cmd.startswith("TS源 间隔 ") or full_cmd.startswith("TS源 超时 "):
+                try:
+                    _, action, name, seconds = full_cmd.split(" ", 3)
+                    seconds = int(seconds)
+                    if action == "间隔" and seconds < 10:
+                        self.send_response("❌ 间隔时间不能小于10秒")
+                        return
+                    key = 'interval' if action == "间隔" else 'timeout'
+                    for sitemap in self.engine.data['sitemaps']:
+                        if sitemap['name'] == name:
+                            sitemap[key] = seconds
+                            self.engine.save_data()
+                            self.engine.start_monitor()  # 按新的间隔重新计算下次检查时间
+                            self.send_response(f"✅ 已设置数据源 {name} 的{action}为{seconds}秒")
+                            break
+                    else:
+                        self.send_response("❌ 未找到该数据源")
+                except ValueError:
+                    self.send_response("❌ 格式错误，请使用：TS源 间隔/超时 <名称> <秒数>")
+            elif full_cmd.startswith("TS源 选择器 "):
+                try:
+                    _, _, name, field, selector = full_cmd.split(" ", 4)
+                    fields = {"标题": "title", "作者": "author"}
+                    if field not in fields:
+                        self.send_response("❌ 字段只能是：标题 或 作者")
+                        return
+                    for sitemap in self.engine.data['sitemaps']:
+                        if sitemap['name'] == name:
+                            sitemap.setdefault('selectors', {})[fields[field]] = selector.strip()
+                            self.engine.save_data()
+                            self.send_response(f"✅ 已设置数据源 {name} 的{field}选择器为：{selector.strip()}")
+                            break
+                    else:
+                        self.send_response("❌ 未找到该数据源")
+                except ValueError:
+                    self.send_response("❌ 格式错误，请使用：TS源 选择器 <名称> <标题/作者> <CSS选择器>")
+            elif full_cmd.startswith("TS源 元数据 "):
+                try:
+                    _, _, name, value = full_cmd.split(" ", 3)
+                    names = [] if value.strip() == "页面" else [v.strip() for v in value.split(",") if v.strip()]
+                    invalid = [v for v in names if v not in METADATA_SOURCES]
+                    if invalid:
+                        self.send_response(f"❌ 不支持的来源：{', '.join(invalid)}，可选：{', '.join(METADATA_SOURCES)} 或 页面")
+                        return
+                    for sitemap in self.engine.data['sitemaps']:
+                        if sitemap['name'] == name:
+                            sitemap['metadata'] = names
+                            self.engine.save_data()
+                            self.send_response(f"✅ 已设置数据源 {name} 的详情来源为：{', '.join(names) or '页面'}")
+                            break
+                    else:
+                        self.send_response("❌ 未找到该数据源")
+                except ValueError:
+                    self.send_response("❌ 格式错误，请使用：TS源 元数据 <名称> <来源,...|页面>")
             elif full_cmd.startswith("TS源 开启 ") or full_cmd.startswith("TS源 关闭 "):
                 name = full_cmd[6:].strip()
                 enable = full_cmd.startswith("TS源 开启 ")
-                for sitemap in self.data['sitemaps']:
+                for sitemap in self.engine.data['sitemaps']:
                     if sitemap['name'] == name:
                         sitemap['enabled'] = enable
-                        self._save_data()
+                        self.engine.save_data()
+                        self.engine.start_monitor()
                         self.send_response(f"{'✅ 已启用' if enable else '⛔ 已禁用'}数据源：{name}")
                         break
                 else:
@@ -969,31 +3996,44 @@ class Forum_monitor(Plugin):
             # 推送模板命令
             elif full_cmd.startswith("TS模板 添加 "):
                 try:
-                    _, name, content = full_cmd[8:].split(" ", 1)
-                    if name not in self.data['templates']:
-                        self.data['templates'][name] = content
-                        self._save_data()
-                        self.send_response(f"✅ 已添加模板：{name}")
-                    else:
-                        self.send_response("❌ 该模板名称已存在")
+                    name, content = full_cmd[8:].split(" ", 1)
                 except ValueError:
                     self.send_response("❌ 格式错误，请使用：TS模板 添加 <名称> <内容>")
+                    return
+                if name in self.engine.data['templates']:
+                    self.send_response("❌ 该模板名称已存在")
+                    return
+                try:
+                    MessageTemplate(content)
+                except ValueError as e:
+                    self.send_response(f"❌ 模板无效：{e}")
+                    return
+                self.engine.data['templates'][name] = content
+                self.engine.save_data()
+                self.send_response(f"✅ 已添加模板：{name}")
             elif full_cmd.startswith("TS模板 删除 "):
                 name = full_cmd[8:].strip()
-                if name in self.data['templates'] and name not in ['default', 'simple']:
-                    del self.data['templates'][name]
-                    self._save_data()
+                if name in self.engine.data['templates'] and name not in ['default', 'simple']:
+                    del self.engine.data['templates'][name]
+                    self.engine.save_data()
                     self.send_response(f"✅ 已删除模板：{name}")
                 else:
                     self.send_response("❌ 无法删除该模板")
             elif full_cmd == "TS模板 列表":
-                template_list = "\n".join([f"• {name}" for name in self.data['templates'].keys()])
-                self.send_response(f"📝 可用模板列表：\n{template_list}")
+                current = self.engine.data.get('current_template')
+                lines = ["📝 可用模板列表："]
+                for name, content in self.engine.data['templates'].items():
+                    if isinstance(content, str):
+                        lines.append(f"• {name}{'（当前）' if name == current else ''}")
+                if not current:
+                    lines.append("当前使用内置的默认格式")
+                lines.append(f"可用占位符：{MessageTemplate.placeholders()}")
+                self.send_response("\n".join(lines))
             elif full_cmd.startswith("TS模板 设置 "):
                 name = full_cmd[8:].strip()
-                if name in self.data['templates']:
-                    self.data['current_template'] = name
-                    self._save_data()
+                if isinstance(self.engine.data['templates'].get(name), str):
+                    self.engine.data['current_template'] = name
+                    self.engine.save_data()
                     self.send_response(f"✅ 已设置当前模板为：{name}")
                 else:
                     self.send_response("❌ 未找到该模板")
@@ -1001,34 +4041,35 @@ class Forum_monitor(Plugin):
             # 分组管理命令
             elif full_cmd.startswith("TS分组 创建 "):
                 name = full_cmd[8:].strip()
-                if name not in self.data['groups']['custom']:
-                    self.data['groups']['custom'][name] = {
+                if name not in self.engine.data['groups']['custom']:
+                    self.engine.data['groups']['custom'][name] = {
                         'notify_groups': [],
                         'notify_users': []
                     }
-                    self._save_data()
+                    self.engine.save_data()
                     self.send_response(f"✅ 已创建分组：{name}")
                 else:
                     self.send_response("❌ 该分组名称已存在")
             elif full_cmd.startswith("TS分组 删除 "):
                 name = full_cmd[8:].strip()
-                if name in self.data['groups']['custom']:
-                    del self.data['groups']['custom'][name]
-                    self._save_data()
+                if name in self.engine.data['groups']['custom']:
+                    del self.engine.data['groups']['custom'][name]
+                    self.engine.save_data()
                     self.send_response(f"✅ 已删除分组：{name}")
                 else:
                     self.send_response("❌ 未找到该分组")
             elif full_cmd.startswith("TS分组 添加 "):
                 try:
-                    _, group_name, target_id = full_cmd[8:].split(" ", 1)
-                    if group_name in self.data['groups']['custom']:
+                    group_name, target_id = full_cmd[8:].split(" ", 1)
+                    target_id = target_id.strip()
+                    if group_name in self.engine.data['groups']['custom']:
                         if '@chatroom' in target_id:
-                            if target_id not in self.data['groups']['custom'][group_name]['notify_groups']:
-                                self.data['groups']['custom'][group_name]['notify_groups'].append(target_id)
+                            if target_id not in self.engine.data['groups']['custom'][group_name]['notify_groups']:
+                                self.engine.data['groups']['custom'][group_name]['notify_groups'].append(target_id)
                         else:
-                            if target_id not in self.data['groups']['custom'][group_name]['notify_users']:
-                                self.data['groups']['custom'][group_name]['notify_users'].append(target_id)
-                        self._save_data()
+                            if target_id not in self.engine.data['groups']['custom'][group_name]['notify_users']:
+                                self.engine.data['groups']['custom'][group_name]['notify_users'].append(target_id)
+                        self.engine.save_data()
                         self.send_response(f"✅ 已添加推送对象到分组：{group_name}")
                     else:
                         self.send_response("❌ 未找到该分组")
@@ -1036,57 +4077,107 @@ class Forum_monitor(Plugin):
                     self.send_response("❌ 格式错误，请使用：TS分组 添加 <分组> <群ID/用户ID>")
             elif full_cmd.startswith("TS分组 移除 "):
                 try:
-                    _, group_name, target_id = full_cmd[8:].split(" ", 1)
-                    if group_name in self.data['groups']['custom']:
+                    group_name, target_id = full_cmd[8:].split(" ", 1)
+                    target_id = target_id.strip()
+                    if group_name in self.engine.data['groups']['custom']:
                         if '@chatroom' in target_id:
-                            if target_id in self.data['groups']['custom'][group_name]['notify_groups']:
-                                self.data['groups']['custom'][group_name]['notify_groups'].remove(target_id)
+                            if target_id in self.engine.data['groups']['custom'][group_name]['notify_groups']:
+                                self.engine.data['groups']['custom'][group_name]['notify_groups'].remove(target_id)
                         else:
-                            if target_id in self.data['groups']['custom'][group_name]['notify_users']:
-                                self.data['groups']['custom'][group_name]['notify_users'].remove(target_id)
-                        self._save_data()
+                            if target_id in self.engine.data['groups']['custom'][group_name]['notify_users']:
+                                self.engine.data['groups']['custom'][group_name]['notify_users'].remove(target_id)
+                        self.engine.save_data()
                         self.send_response(f"✅ 已从分组移除推送对象：{group_name}")
                     else:
                         self.send_response("❌ 未找到该分组")
                 except ValueError:
                     self.send_response("❌ 格式错误，请使用：TS分组 移除 <分组> <群ID/用户ID>")
+            elif full_cmd.startswith("TS分组 模板 "):
+                try:
+                    group_name, template_name = full_cmd[8:].split(" ", 1)
+                except ValueError:
+                    self.send_response("❌ 格式错误，请使用：TS分组 模板 <分组> <模板名|默认>")
+                    return
+                template_name = template_name.strip()
+                group = self.engine.data['groups']['custom'].get(group_name)
+                if group is None:
+                    self.send_response("❌ 未找到该分组")
+                elif template_name == "默认":
+                    group.pop('template', None)
+                    self.engine.save_data()
+                    self.send_response(f"✅ 分组 {group_name} 已改用当前模板")
+                elif isinstance(self.engine.data['templates'].get(template_name), str):
+                    group['template'] = template_name
+                    self.engine.save_data()
+                    self.send_response(f"✅ 已设置分组 {group_name} 的模板为：{template_name}")
+                else:
+                    self.send_response("❌ 未找到该模板")
+            elif full_cmd.startswith("TS分组 来源 ") or full_cmd.startswith("TS分组 关键词 "):
+                try:
+                    _, action, group_name, value = full_cmd.split(" ", 3)
+                except ValueError:
+                    self.send_response("❌ 格式错误，请使用：TS分组 来源/关键词 <分组> <名称,...|全部>")
+                    return
+                group = self.engine.data['groups']['custom'].get(group_name)
+                if group is None:
+                    self.send_response("❌ 未找到该分组")
+                    return
+                values = [] if value.strip() == "全部" else [v.strip() for v in value.split(",") if v.strip()]
+                if action == "来源":
+                    known = {sitemap['name'] for sitemap in self.engine.sources()}
+                    unknown = [v for v in values if v not in known]
+                    if unknown:
+                        self.send_response(f"❌ 未找到数据源：{', '.join(unknown)}")
+                        return
+                group['sources' if action == "来源" else 'keywords'] = values
+                self.engine.save_data()
+                self.send_response(f"✅ 已设置分组 {group_name} 的{action}为：{', '.join(values) or '全部'}")
             elif full_cmd == "TS分组 列表":
                 group_list = ["📋 推送分组列表："]
                 # 添加默认分组信息
                 group_list.append("\n默认分组：")
-                group_list.append(f"• 群聊：{len(self.data['groups']['default']['notify_groups'])}个")
-                group_list.append(f"• 用户：{len(self.data['groups']['default']['notify_users'])}个")
+                group_list.append(f"• 群聊：{len(self.engine.data['groups']['default']['notify_groups'])}个")
+                group_list.append(f"• 用户：{len(self.engine.data['groups']['default']['notify_users'])}个")
+                group_list.append("  （config.yaml中的推送对象和TS添加推送的群也属于默认分组）")
+                group_list.append(self.format_route_stats(RoutingIndex.DEFAULT_ROUTE))
                 # 添加自定义分组信息
-                if self.data['groups']['custom']:
+                if self.engine.data['groups']['custom']:
                     group_list.append("\n自定义分组：")
-                    for name, group in self.data['groups']['custom'].items():
+                    for name, group in self.engine.data['groups']['custom'].items():
                         group_list.append(f"• {name}:")
                         group_list.append(f"  - 群聊：{len(group['notify_groups'])}个")
                         group_list.append(f"  - 用户：{len(group['notify_users'])}个")
+                        if group.get('template'):
+                            group_list.append(f"  - 模板：{group['template']}")
+                        group_list.append(f"  - 来源：{', '.join(group.get('sources') or []) or '全部'}")
+                        group_list.append(f"  - 关键词：{', '.join(group.get('keywords') or []) or '全部'}")
+                        group_list.append(self.format_route_stats(name))
                 self.send_response("\n".join(group_list))
             
             # 历史记录管理命令
             elif full_cmd == "TS历史清理 开启":
-                self.data['settings']['history_cleanup']['enabled'] = True
-                self._save_data()
+                self.engine.data['settings']['history_cleanup']['enabled'] = True
+                self.engine.save_data()
+                self.engine.start_cleanup_job()
                 self.send_response("✅ 已开启历史记录自动清理")
             elif full_cmd == "TS历史清理 关闭":
-                self.data['settings']['history_cleanup']['enabled'] = False
-                self._save_data()
+                self.engine.data['settings']['history_cleanup']['enabled'] = False
+                self.engine.save_data()
+                self.engine.jobs.cancel('cleanup')
                 self.send_response("⛔ 已关闭历史记录自动清理")
             elif full_cmd.startswith("TS历史天数 "):
                 try:
                     days = int(full_cmd.split(" ")[1])
                     if days > 0:
-                        self.data['settings']['history_cleanup']['max_days'] = days
-                        self._save_data()
+                        self.engine.data['settings']['history_cleanup']['max_days'] = days
+                        self.engine.save_data()
                         self.send_response(f"✅ 已设置历史记录保留{days}天")
                     else:
                         self.send_response("❌ 保留天数必须大于0")
                 except:
                     self.send_response("❌ 请指定有效的天数")
             elif full_cmd == "TS历史立即清理":
-                self._cleanup_history()
+                self.engine.cleanup_history()
                 self.send_response("✅ 已执行历史记录清理")
             elif full_cmd == "TS历史记录":
                 self.send_response("正在导出历史记录...")
@@ -1104,9 +4195,10 @@ class Forum_monitor(Plugin):
                     self.send_response("❌ 请在群聊中使用此命令")
                     return
                 # 添加群ID到推送列表
-                if group_id not in self.data['push_list']:
-                    self.data['push_list'].append(group_id)
-                    self._save_data()
+                push_list = self.engine.data.setdefault('push_list', [])
+                if group_id not in push_list:
+                    push_list.append(group_id)
+                    self.engine.save_data()
                     self.send_response("✅ 已添加群ID到推送列表")
                 else:
                     self.send_response("❌ 群ID已在推送列表中")
@@ -1119,9 +4211,9 @@ class Forum_monitor(Plugin):
                     self.send_response("❌ 请在群聊中使用此命令")
                     return
                 # 从推送列表中删除群ID
-                if group_id in self.data['push_list']:
-                    self.data['push_list'].remove(group_id)
-                    self._save_data()
+                if group_id in self.engine.data.get('push_list', []):
+                    self.engine.data['push_list'].remove(group_id)
+                    self.engine.save_data()
                     self.send_response("✅ 已从推送列表中删除群ID")
                 else:
                     self.send_response("❌ 群ID不在推送列表中")
@@ -1150,123 +4242,81 @@ class Forum_monitor(Plugin):
         """插件运行入口"""
         try:
             self.init_config_data()
+            self.engine.update_config(self.wcf, self.config)
             if self.filter_msg():
                 self.deal_msg()
         except Exception as e:
             print(f"插件运行错误: {e}")
 
-    def __del__(self):
-        """析构函数，确保线程正确退出"""
-        try:
-            self._stop_event.set()  # 停止所有线程
-            if self._monitor_thread:
-                self._monitor_thread.join(timeout=1)
-            if self._backup_thread:
-                self._backup_thread.join(timeout=1)
-            if self._retry_thread:
-                self._retry_thread.join(timeout=1)
-            if self._cleanup_thread:
-                self._cleanup_thread.join(timeout=1)
-            self._save_data()
-        except Exception as e:
-            print(f"插件清理错误: {e}")
-
-    def _start_backup_thread(self):
-        """启动备份线程"""
-        if self._backup_thread is None or not self._backup_thread.is_alive():
-            self._backup_thread = Thread(target=self._backup_loop, name="BackupThread", daemon=True)
-            self._backup_thread.start()
-
-    def _start_retry_thread(self):
-        """启动重试线程"""
-        if self._retry_thread is None or not self._retry_thread.is_alive():
-            self._retry_thread = Thread(target=self._retry_loop, name="RetryThread", daemon=True)
-            self._retry_thread.start()
-
-    def _start_cleanup_thread(self):
-        """启动清理线程"""
-        if self._cleanup_thread is None or not self._cleanup_thread.is_alive():
-            self._cleanup_thread = Thread(target=self._cleanup_loop, name="CleanupThread", daemon=True)
-            self._cleanup_thread.start()
-
-    def _backup_loop(self):
-        """备份循环"""
-        while not self._stop_event.is_set():
-            if self.data['settings']['backup']['enabled']:
-                self._create_backup()
-            self._stop_event.wait(self.data['settings']['backup']['interval'])
-
-    def _retry_loop(self):
-        """重试循环"""
-        while not self._stop_event.is_set():
-            if self.data['settings']['retry']['enabled'] and self._retry_queue:
-                self._process_retry_queue()
-            self._stop_event.wait(self.data['settings']['retry']['delay'])
-
-    def _cleanup_loop(self):
-        """清理循环"""
-        while not self._stop_event.is_set():
-            if self.data['settings']['history_cleanup']['enabled']:
-                self._cleanup_history()
-            self._stop_event.wait(86400)  # 每天检查一次
-
-    def _create_backup(self):
-        """创建备份"""
+    def export_history(self):
+        """导出历史记录"""
         try:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_file = os.path.join(self._backup_dir, f'backup_{timestamp}.json')
-            shutil.copy2(self._data_file, backup_file)
+            # 创建历史记录文本
+            history_text = "📑 论坛监控历史记录\n" + "=" * 50 + "\n\n"
+            for record in self.engine.records.records():
+                history_text += (
+                    f"🕒 时间：{record['time']}\n"
+                    f"📌 标题：{record['title']}\n"
+                    f"👤 作者：{record['author']}\n"
+                    f"🔗 链接：{record['url']}\n"
+                    f"📝 状态：{'再次推送' if record.get('status') == 'reposted' else '首次推送'}\n"
+                    + "-" * 30 + "\n"
+                )
             
-            # 清理旧备份
-            backups = sorted([f for f in os.listdir(self._backup_dir) if f.startswith('backup_')])
-            max_backups = self.data['settings']['backup']['max_backups']
-            if len(backups) > max_backups:
-                for old_backup in backups[:-max_backups]:
-                    os.remove(os.path.join(self._backup_dir, old_backup))
+            # 直接发送文本消息而不是文件
+            self.wcf.send_text(history_text, self.msg.sender, None)
+            return True
         except Exception as e:
-            print(f"创建备份失败: {e}")
-
-    def _process_retry_queue(self):
-        """处理重试队列"""
-        if not self._retry_queue:
-            return
+            print(f"导出历史记录失败: {e}")
+            return False
             
-        retry_item = self._retry_queue[0]
-        if retry_item['attempts'] < self.data['settings']['retry']['max_attempts']:
-            success = self.process_post(retry_item['url'], retry_item.get('lastmod'))
-            if success:
-                self._retry_queue.pop(0)
-            else:
-                retry_item['attempts'] += 1
-        else:
-            self._retry_queue.pop(0)
-            self.data['statistics']['failed_pushes'] += 1
-            self._save_data()
+    def format_route_stats(self, route):
+        """格式化一个路由（分组）启动以来的推送统计"""
+        stats = self.engine.route_stats_for(route)
+        return f"  - 推送：帖子 {stats['posts']} 条，成功 {stats['sent']} 次，失败 {stats['failed']} 次"
 
-    def _cleanup_history(self):
-        """清理历史记录"""
-        if not self.data['settings']['history_cleanup']['enabled']:
-            return
-            
-        max_days = self.data['settings']['history_cleanup']['max_days']
-        cutoff_date = datetime.now() - timedelta(days=max_days)
-        
-        new_history = []
-        for record in self._history:
-            try:
-                record_date = datetime.strptime(record['time'], '%Y年%m月%d日 %H:%M:%S')
-                if record_date > cutoff_date:
-                    new_history.append(record)
-            except:
-                new_history.append(record)
-        
-        self._history = new_history
-        self._save_data()
+    def format_filter(self):
+        """格式化内容过滤的词表及各词的命中次数"""
+        settings = self.engine.data['settings']['content_filter']
+        lines = [f"📝 内容过滤：{'✅ 开启' if settings.get('enabled') else '⛔ 关闭'}"]
+        for kind, label in (('keywords', "过滤关键词（设置后只推送命中其一的帖子）"),
+                            ('blacklist', "黑名单（命中则不推送）"),
+                            ('whitelist', "白名单（命中则一定推送，优先于黑名单）")):
+            words = settings.get(kind, [])
+            lines.append(f"{label}：" if words else f"{label}：无")
+            for word in words:
+                lines.append(f"• {word}（命中 {self.engine.filter_hits[(kind, word)]} 次）")
+        return "\n".join(lines)
+
+    def format_sources(self):
+        """格式化数据源列表及各源的运行状态"""
+        lines = []
+        for sitemap in self.engine.data['sitemaps']:
+            lines.append(f"• {sitemap['name']}: {sitemap['url']} ({'启用' if sitemap['enabled'] else '禁用'})")
+            lines.append(f"  间隔：{self.engine.source_interval(sitemap)}秒")
+            if sitemap.get('timeout'):
+                lines.append(f"  超时：{sitemap['timeout']}秒")
+            if sitemap.get('metadata'):
+                lines.append(f"  详情来源：{', '.join(sitemap['metadata'])}")
+            for field, label in (('title', '标题'), ('author', '作者')):
+                if sitemap.get('selectors', {}).get(field):
+                    lines.append(f"  {label}选择器：{sitemap['selectors'][field]}")
+        for source in self.engine.sources():
+            status = self.engine.source_status(source['url'])
+            last_success = (
+                datetime.fromtimestamp(status['last_success']).strftime("%Y-%m-%d %H:%M:%S")
+                if status['last_success'] else "无"
+            )
+            lines.append(
+                f"◦ {source['name']} 最近成功：{last_success}，"
+                f"连续失败：{status['failures']}次，累计失败：{status['total_failures']}次"
+            )
+        return "\n".join(lines)
 
     def format_history(self):
         """格式化历史记录"""
         history_text = "📑 论坛监控历史记录\n==================================================\n"
-        for record in self._history:
+        for record in self.engine.records.records():
             history_text += (
                 f"\n🕒 时间：{record['time']}\n"
                 f"📌 标题：{record['title']}\n"
@@ -1275,4 +4325,4 @@ class Forum_monitor(Plugin):
                 f"📝 状态：{record['status']}\n"
                 "------------------------------"
             )
-        return history_text
\ No newline at end of file
+        return history_text
@@ -0,0 +1,220 @@
+"""
+高水位去重的测试：WatermarkDedup的指纹保留期，以及用本地HTTP服务模拟一个长期运行的论坛sitemap，
+逐轮调用引擎检查，确认每个帖子只推送一次、指纹数不超过保留期内的帖子数
+
+回放内容：同一时间发布的帖子、晚于高水位到达的帖子（lastmod早于已见最新时间）、
+旧帖被编辑后lastmod变新并回到sitemap顶部、定期清空历史记录；
+前1/3轮使用set模式，之后重启切换为watermark模式（触发迁移），2/3处再重启一次
+
+不需要机器人框架：找不到plugins.plugin时换成空的Plugin基类
+    python -m pytest tests    或    python -m unittest discover tests
+"""
+import atexit
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import types
+import unittest
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    import plugins.plugin  # noqa: F401
+except ImportError:
+    plugin_module = types.ModuleType('plugins.plugin')
+    plugin_module.Plugin = type('Plugin', (), {})
+    sys.modules['plugins'] = types.ModuleType('plugins')
+    sys.modules['plugins'].plugin = plugin_module
+    sys.modules['plugins.plugin'] = plugin_module
+
+from forum_monitor import MonitorEngine, WatermarkDedup  # noqa: E402
+
+WINDOW = 50
+GRACE = 3600
+RETENTION = 6 * 3600
+SITEMAP_SIZE = 150
+ROUNDS = 300
+
+
+def iso(dt):
+    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class ForumHandler(BaseHTTPRequestHandler):
+    """sitemap取自server.sitemap，帖子页面按zibll主题的默认选择器生成"""
+
+    def do_GET(self):
+        if self.path == '/sitemap.xml':
+            body = self.server.sitemap
+        elif self.path.startswith('/p/'):
+            number = self.path.rsplit('/', 1)[1]
+            body = (
+                f'<html><body><h1 class="article-title"><a title="帖子{number}">帖子{number}</a></h1>'
+                f'<div class="meta-left"><span class="display-name">作者{number}</span></div></body></html>'
+            ).encode('utf-8')
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def urlset(entries):
+    items = ''.join(f'<url><loc>{loc}</loc><lastmod>{lastmod}</lastmod></url>' for loc, lastmod in entries)
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{items}</urlset>'
+    ).encode('utf-8')
+
+
+class WatermarkDedupTest(unittest.TestCase):
+
+    def test_archive_bounded_by_retention(self):
+        dedup = WatermarkDedup(window=10, grace=600, retention=3600)
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        for minute in range(5000):
+            dedup.mark(f'https://forum.example.com/p/{minute}', iso(start + timedelta(minutes=minute)), 'sitemap')
+        dedup.to_dict()
+        # 保留期内每分钟一个帖子，减去仍在最近窗口中的
+        self.assertLessEqual(dedup.archived_count(), 61 - 10 + 1)
+        # 丢掉指纹的旧帖由高水位判断为已处理
+        self.assertTrue(dedup.contains('https://forum.example.com/p/0', iso(start), 'sitemap'))
+        # 保留期内的帖子被编辑后仍能认出
+        self.assertTrue(dedup.contains('https://forum.example.com/p/4960', iso(start + timedelta(days=30)), 'sitemap'))
+        self.assertTrue(dedup.outdated('https://forum.example.com/p/4960', iso(start + timedelta(days=30))))
+
+    def test_retention_not_shorter_than_grace(self):
+        self.assertEqual(WatermarkDedup(grace=7200, retention=60).retention, 7200)
+
+    def test_round_trip_and_legacy_archive(self):
+        dedup = WatermarkDedup(window=1, grace=60, retention=3600)
+        dedup.mark('https://a/1', '2025-01-01T00:00:00Z', 'sitemap')
+        dedup.mark('https://a/2', '2025-01-01T00:01:00Z', 'sitemap')
+        dedup.mark('https://a/3')
+        dedup.mark('https://a/4')
+        state = json.loads(json.dumps(dedup.to_dict()))
+        loaded = WatermarkDedup(window=1, grace=60, retention=3600)
+        loaded.load(state)
+        self.assertEqual(len(loaded), 4)
+        for url in ('https://a/1', 'https://a/2', 'https://a/3', 'https://a/4'):
+            self.assertTrue(loaded.contains(url))
+        loaded.discard('https://a/1')
+        self.assertFalse(loaded.contains('https://a/1'))
+
+        # 旧格式的archived是一个不分源的指纹数组
+        state['archived'] = dedup._encode(dedup.archived['sitemap'][0])
+        state['recent'] = [[url, ts] for url, ts, _ in state['recent']]
+        loaded.load(state)
+        self.assertTrue(loaded.contains('https://a/1'))
+        self.assertEqual(list(loaded.archived), [''])
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ForumHandler)
+        self.server.sitemap = urlset([])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f'http://127.0.0.1:{self.server.server_port}'
+        self.workdir = tempfile.mkdtemp()
+        self.engine = None
+
+    def tearDown(self):
+        self.stop_engine()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def stop_engine(self):
+        if self.engine is not None:
+            self.engine.shutdown()
+            # 引擎在退出时还会再保存一次，临时目录届时已删除
+            atexit.unregister(self.engine.shutdown)
+            self.engine = None
+
+    def start_engine(self, mode, sent):
+        """按指定去重方式创建引擎，推送只计数"""
+        self.stop_engine()
+        config = {
+            'sitemap_url': self.base + '/sitemap.xml',
+            'notify_groups': [],
+            'notify_users': [],
+            'dedup': {'mode': mode, 'window': WINDOW, 'grace': GRACE, 'retention': RETENTION},
+            'pipeline': {'max_per_cycle': 1000},
+        }
+        engine = MonitorEngine(
+            None, config, os.path.join(self.workdir, 'data.json'), os.path.join(self.workdir, 'backups')
+        )
+        engine.is_running = True
+        engine.ignore_old = False
+        engine.send_notifications = lambda post, source=None: sent.update([post['url']])
+        self.engine = engine
+        return engine
+
+    def test_each_post_pushed_once(self):
+        rng = random.Random(7)
+        source = {'name': '回放', 'url': self.base + '/sitemap.xml'}
+        sent = Counter()
+        engine = self.start_engine('set', sent)
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        posts = {}  # url -> lastmod
+        repushable = Counter()  # 上次lastmod已超出保留期时被编辑的次数，这些编辑允许再推送一次
+        migrated = 0
+        for round_number in range(ROUNDS):
+            now = start + timedelta(minutes=10 * round_number)
+            for _ in range(rng.randint(0, 8)):
+                # 一部分帖子与他人同一时间，一部分晚于已见的最新时间才出现在sitemap中
+                posts[f'{self.base}/p/{len(posts) + 1}'] = now - timedelta(seconds=rng.choice([0, 0, 0, 30, 600, 1800]))
+            # 任意旧帖都可能被编辑，lastmod变新后回到sitemap顶部
+            newest = max(posts.values(), default=now)
+            for url in rng.sample(list(posts), min(2, len(posts))):
+                if rng.random() < 0.3:
+                    if posts[url] < newest - timedelta(seconds=RETENTION):
+                        repushable[url] += 1
+                    posts[url] = now
+            latest = sorted(posts.items(), key=lambda item: item[1], reverse=True)[:SITEMAP_SIZE]
+            self.server.sitemap = urlset([(url, iso(lastmod)) for url, lastmod in latest])
+            engine._check_source(source)
+            if round_number % 10 == 9:
+                # 历史记录全部清理，去重只能依靠高水位、最近窗口和指纹
+                engine.records.cleanup_before(datetime.now())
+            if round_number in (ROUNDS // 3, ROUNDS * 2 // 3):
+                if round_number == ROUNDS // 3:
+                    migrated = len(posts)
+                engine = self.start_engine('watermark', sent)
+
+        engine.store.compact()
+        with open(os.path.join(self.workdir, 'data.json'), encoding='utf-8') as f:
+            snapshot = json.load(f)
+        dedup = engine.store.dedup
+
+        self.assertEqual(sorted(set(posts) - set(sent)), [])
+        overpushed = {url: count - 1 for url, count in sent.items() if count - 1 > repushable[url]}
+        self.assertEqual(overpushed, {})
+        self.assertFalse(snapshot.get('processed_urls'))
+        self.assertLessEqual(len(snapshot['dedup']['recent']), WINDOW)
+
+        # 有lastmod的指纹只保留高水位之前RETENTION秒内的，迁移时不知道时间的按移出窗口的时间保留
+        cutoff = max(posts.values()) - timedelta(seconds=RETENTION)
+        in_retention = sum(lastmod >= cutoff for lastmod in posts.values())
+        self.assertLessEqual(len(dedup.archived.get(source['url'], ((), ()))[0]), in_retention)
+        self.assertLessEqual(len(dedup.archived.get('', ((), ()))[0]), migrated)
+        self.assertLessEqual(dedup.archived_count(), in_retention + migrated)
+        self.assertLess(dedup.archived_count(), len(posts) - WINDOW)
+
+
+if __name__ == '__main__':
+    unittest.main()